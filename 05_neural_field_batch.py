@@ -0,0 +1,121 @@
+"""
+Headless counterpart of 05_neural_field.py: fits one neural field per image of a
+directory, training up to `--fields_per_batch` fields at once with BatchedMlpField
+(shared pixel grid and encoding, one loss per image).
+
+Saves, for each image, the final prediction and a checkpoint that 05_neural_field.py
+can warm-start from (`--warm_start`):
+    python 05_neural_field_batch.py --images path/to/images --output outputs/neural_fields
+"""
+
+import os
+import time
+from argparse import ArgumentParser
+
+import torch
+
+from utils.checkpoint import write_checkpoint
+from utils.images import list_images, load_image, save_image
+from utils.mlp_field import BatchedMlpField, normalized_pixel_grid
+
+LR = 5e-3
+LOG_EVERY = 100
+
+
+def fit_fields(images: torch.Tensor, steps: int, batch_size: int):
+    """
+    images     : [B, H, W, 3] targets (same resolution)
+    batch_size : number of pixels (the same for all images) per step, 0 for all of them
+    Returns the trained BatchedMlpField, the [B, H, W, 3] predictions and the [B] PSNRs
+    """
+    num_fields, height, width, _ = images.shape
+    device = images.device
+    model = BatchedMlpField(
+        num_fields, input_dim=2, output_dim=3, pe_freqs=8, num_layers=2, hidden_dim=64
+    ).to(device)
+    optimizer = torch.optim.Adam(model.parameters(), lr=LR)
+
+    # The pixel grid (and its encoding) is shared by all fields
+    pixel_pos = normalized_pixel_grid(height, width, device=device).reshape(-1, 2)
+    with torch.no_grad():
+        pixel_enc = model.encode(pixel_pos)
+    targets = images.reshape(num_fields, -1, 3)
+
+    for i_step in range(steps):
+        if 0 < batch_size < len(pixel_enc):
+            pixels = torch.randint(len(pixel_enc), (batch_size,), device=device)
+            pred = model.forward_encoded(pixel_enc[pixels])
+            target = targets[:, pixels]
+        else:
+            pred = model.forward_encoded(pixel_enc)
+            target = targets
+        # Per-image MSEs, summed: each field gets the gradient of its own loss
+        losses = (pred - target).square().mean(dim=(1, 2))
+
+        optimizer.zero_grad()
+        losses.sum().backward()
+        optimizer.step()
+
+        if (i_step + 1) % LOG_EVERY == 0:
+            psnrs = -10.0 * torch.log10(losses.detach())
+            print(
+                f"  step {i_step + 1:5d}/{steps}: PSNR (batch) "
+                f"min {psnrs.min().item():.2f} / mean {psnrs.mean().item():.2f} dB"
+            )
+
+    with torch.no_grad():
+        pred = model.forward_encoded(pixel_enc).clamp(0, 1)
+        psnrs = -10.0 * torch.log10((pred - targets).square().mean(dim=(1, 2)))
+    return model, pred.view(images.shape), psnrs
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--device", type=str, choices=["cpu", "cuda"], default="cpu")
+    parser.add_argument("--images", type=str, required=True, help="image directory")
+    parser.add_argument("--output", type=str, default="outputs/neural_fields")
+    parser.add_argument("--res", type=int, default=256)
+    parser.add_argument("--steps", type=int, default=1000)
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=4096,
+        help="pixels per image and per step (0: full images)",
+    )
+    parser.add_argument(
+        "--fields_per_batch",
+        type=int,
+        default=16,
+        help="number of images fitted at once (bounds memory)",
+    )
+    args = parser.parse_args()
+
+    paths = list_images(args.images)
+    if not paths:
+        raise ValueError(f"No images found in {args.images}")
+    print(f"Fitting {len(paths)} images at {args.res}x{args.res}")
+
+    start = time.perf_counter()
+    for first in range(0, len(paths), args.fields_per_batch):
+        group = paths[first : first + args.fields_per_batch]
+        print(f"Images {first + 1}-{first + len(group)}/{len(paths)}")
+        images = torch.stack([load_image(p, args.res, args.device) for p in group])
+        model, preds, psnrs = fit_fields(images, args.steps, args.batch_size)
+
+        for i, path in enumerate(group):
+            name = os.path.splitext(os.path.basename(path))[0]
+            save_image(os.path.join(args.output, f"{name}.png"), preds[i])
+            write_checkpoint(
+                os.path.join(args.output, f"{name}.pt"),
+                dict(
+                    config=dict(image_path=path, res=args.res, encoding="frequency"),
+                    model=model.field(i).state_dict(),
+                    step=args.steps,
+                ),
+            )
+            print(f"  {name}: PSNR {psnrs[i].item():.2f} dB")
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"Done in {elapsed:.1f} s ({len(paths) * args.steps / elapsed:.1f} field-steps/s)"
+    )
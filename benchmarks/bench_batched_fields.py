@@ -0,0 +1,120 @@
+"""
+Compares fitting B images with B separate MlpFields (one after the other, as with
+one 05_neural_field.py process per image) and with a single BatchedMlpField:
+reports field-steps/sec for full images and pixel minibatches.
+
+Also checks that batched training matches separate training (same initialization,
+same pixels): Adam is elementwise, so the fields must stay identical.
+
+Run from the root of the repo:
+    python -m benchmarks.bench_batched_fields --num_fields 16 --res 128
+"""
+
+import time
+from argparse import ArgumentParser
+
+import torch
+
+from utils.mlp_field import BatchedMlpField, normalized_pixel_grid
+
+LR = 5e-3
+FIELD_KWARGS = dict(input_dim=2, output_dim=3, pe_freqs=8, num_layers=2, hidden_dim=64)
+
+
+def batched_step(model, optimizer, pixel_enc, targets, pixels):
+    pred = model.forward_encoded(pixel_enc[pixels])
+    losses = (pred - targets[:, pixels]).square().mean(dim=(1, 2))
+    optimizer.zero_grad()
+    losses.sum().backward()
+    optimizer.step()
+
+
+def separate_step(fields, optimizers, pixel_enc, targets, pixels):
+    inputs = pixel_enc[pixels]
+    for field, optimizer, target in zip(fields, optimizers, targets):
+        loss = (field.forward_encoded(inputs) - target[pixels]).square().mean()
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+
+
+def check(num_fields: int, steps: int = 10) -> float:
+    """
+    Max difference between batched and separate predictions after `steps` steps
+    """
+    torch.manual_seed(0)
+    model = BatchedMlpField(num_fields, **FIELD_KWARGS)
+    fields = [model.field(i) for i in range(num_fields)]
+    optimizer = torch.optim.Adam(model.parameters(), lr=LR)
+    optimizers = [torch.optim.Adam(f.parameters(), lr=LR) for f in fields]
+
+    pixel_enc = model.encode(normalized_pixel_grid(32, 32).reshape(-1, 2))
+    targets = torch.rand(num_fields, len(pixel_enc), 3)
+    for _ in range(steps):
+        pixels = torch.randint(len(pixel_enc), (256,))
+        batched_step(model, optimizer, pixel_enc, targets, pixels)
+        separate_step(fields, optimizers, pixel_enc, targets, pixels)
+
+    with torch.no_grad():
+        batched = model.forward_encoded(pixel_enc)
+        return max(
+            (f.forward_encoded(pixel_enc) - batched[i]).abs().max().item()
+            for i, f in enumerate(fields)
+        )
+
+
+def throughput(step, steps: int) -> float:
+    step()
+    start = time.perf_counter()
+    for _ in range(steps):
+        step()
+    return steps / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--num_fields", type=int, default=16)
+    parser.add_argument("--res", type=int, default=128)
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument(
+        "--batch_sizes",
+        type=int,
+        nargs="+",
+        default=[1024, 4096, 0],
+        help="pixels per field and per step (0: full image)",
+    )
+    args = parser.parse_args()
+
+    B = args.num_fields
+    error = check(B)
+    print(f"batched vs separate training: max difference {error:.2e}")
+    print(f"{B} fields at {args.res}x{args.res}, {torch.get_num_threads()} threads")
+
+    torch.manual_seed(0)
+    model = BatchedMlpField(B, **FIELD_KWARGS)
+    fields = [model.field(i) for i in range(B)]
+    optimizer = torch.optim.Adam(model.parameters(), lr=LR)
+    optimizers = [torch.optim.Adam(f.parameters(), lr=LR) for f in fields]
+    with torch.no_grad():
+        pixel_enc = model.encode(
+            normalized_pixel_grid(args.res, args.res).reshape(-1, 2)
+        )
+    targets = torch.rand(B, len(pixel_enc), 3)
+
+    for batch_size in args.batch_sizes:
+        if 0 < batch_size < len(pixel_enc):
+            sample = lambda: torch.randint(len(pixel_enc), (batch_size,))
+        else:
+            sample = lambda: slice(None)
+        batched = B * throughput(
+            lambda: batched_step(model, optimizer, pixel_enc, targets, sample()),
+            args.steps,
+        )
+        separate = B * throughput(
+            lambda: separate_step(fields, optimizers, pixel_enc, targets, sample()),
+            args.steps,
+        )
+        print(
+            f"pixels/step {batch_size or len(pixel_enc):6d}: separate {separate:7.1f}, "
+            f"batched {batched:7.1f} field-steps/s (x{batched / separate:.2f})"
+        )
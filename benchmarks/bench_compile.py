@@ -0,0 +1,78 @@
+"""
+Compares eager, TorchScript and torch.compile training steps of the default
+05_neural_field.py configuration (full image, cached encoding): reports the
+compilation time (first step) and steps/sec.
+
+Run from the root of the repo (a second run reuses the cached compilation):
+    python -m benchmarks.bench_compile --res 256
+"""
+
+import time
+from argparse import ArgumentParser
+
+import torch
+import torch.nn.functional as F
+
+from utils.mlp_field import MlpField, compile_field, normalized_pixel_grid
+
+LR = 5e-3
+
+
+def make_step(model, optimizer, inputs, target, compile_optimizer: bool):
+    optimizer_step = optimizer.step
+    if compile_optimizer:
+        optimizer_step = torch.compile(optimizer.step)
+
+    def step():
+        loss = F.mse_loss(model.forward_encoded(inputs), target)
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer_step()
+        return loss
+
+    return step
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--res", type=int, default=256)
+    parser.add_argument("--steps", type=int, default=50)
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        default=["eager", "torchscript", "torch.compile", "torch.compile+optimizer"],
+    )
+    args = parser.parse_args()
+
+    target = torch.rand(args.res, args.res, 3)
+    pixel_pos = normalized_pixel_grid(args.res, args.res).reshape(-1, 2)
+    target = target.reshape(-1, 3)
+
+    for backend in args.backends:
+        torch.manual_seed(0)
+        model = MlpField(
+            input_dim=2, output_dim=3, pe_freqs=8, num_layers=2, hidden_dim=64
+        )
+        optimizer = torch.optim.Adam(model.parameters(), lr=LR)
+
+        start = time.perf_counter()
+        used = "eager"
+        if backend != "eager":
+            used = compile_field(model, pixel_pos, backend.split("+")[0])
+        with torch.no_grad():
+            inputs = model.encode(pixel_pos)
+        step = make_step(
+            model, optimizer, inputs, target, backend.endswith("optimizer")
+        )
+        step()
+        first = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(args.steps):
+            loss = step()
+        loss.item()
+        elapsed = time.perf_counter() - start
+        print(
+            f"{backend:>23} ({used}): first step {first:6.2f} s, "
+            f"{args.steps / elapsed:6.2f} steps/s, loss {loss.item():.5f}"
+        )
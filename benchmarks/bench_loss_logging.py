@@ -0,0 +1,54 @@
+"""
+Compares the cost of logging one loss per step with `.item()` into a Python list
+(re-plotted entirely every frame) and with LossRecorder, for runs of increasing
+length: time per step (record + one frame of plot data) and stored values.
+
+Run from the root of the repo:
+    python -m benchmarks.bench_loss_logging --steps 1000 10000 50000
+"""
+
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+import torch
+
+from utils.metrics import LossRecorder
+
+
+def log_list(losses):
+    history = []
+    for loss in losses:
+        history.append(loss.item())
+        # (PlotLines converts the whole list to floats every frame)
+        np.asarray(history, dtype=np.float32)
+    return len(history)
+
+
+def log_recorder(losses):
+    recorder = LossRecorder()
+    for loss in losses:
+        recorder.record({"total": loss})
+        np.asarray(recorder.plots.get("total", []), dtype=np.float32)
+    recorder.flush()
+    return len(recorder.plots["total"]) + len(recorder.history_plots["total"])
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--device", type=str, choices=["cpu", "cuda"], default="cpu")
+    parser.add_argument("--steps", type=int, nargs="+", default=[1000, 10000, 50000])
+    args = parser.parse_args()
+
+    for steps in args.steps:
+        # (a loss computed on the device at each step)
+        values = torch.rand(steps, device=args.device)
+        losses = [values[i] * 2.0 for i in range(steps)]
+        for name, log in [("list + item", log_list), ("LossRecorder", log_recorder)]:
+            start = time.perf_counter()
+            stored = log(losses)
+            elapsed = time.perf_counter() - start
+            print(
+                f"{steps:7d} steps, {name:>12}: {1e6 * elapsed / steps:8.2f} us/step, "
+                f"{stored:7d} values plotted"
+            )
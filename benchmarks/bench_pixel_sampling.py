@@ -0,0 +1,69 @@
+"""
+Trains the neural field of 05_neural_field.py (without the viewer) for the same
+wall-clock time on the full image and on minibatches (uniform / error-driven),
+then reports the PSNR of the full-resolution prediction.
+
+Run from the root of the repo:
+    python -m benchmarks.bench_pixel_sampling --res 512 --seconds 30
+"""
+
+import time
+from argparse import ArgumentParser
+
+import torch
+import torch.nn.functional as F
+
+from utils.images import load_image
+from utils.mlp_field import MlpField, normalized_pixel_grid
+from utils.pixel_sampler import PixelSampler
+
+LR = 5e-3
+ERROR_REFRESH = 50
+
+
+def train(image, sampling: str, batch_size: int, seconds: float, device: str):
+    torch.manual_seed(0)
+    model = MlpField(
+        input_dim=2, output_dim=3, pe_freqs=8, num_layers=2, hidden_dim=64
+    ).to(device)
+    optimizer = torch.optim.Adam(model.parameters(), lr=LR)
+    pixel_pos = normalized_pixel_grid(*image.shape[:2], device=device)
+    with torch.no_grad():
+        pixel_enc = model.encode(pixel_pos)
+    sampler = PixelSampler(image)
+
+    steps = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        if sampling == "full image":
+            loss = F.mse_loss(model.forward_encoded(pixel_enc), image)
+        else:
+            importance = sampling == "error-driven"
+            if importance and steps % ERROR_REFRESH == 0:
+                sampler.update_errors(model)
+            coords, weights = sampler.sample(batch_size, importance)
+            pred = model(coords)
+            loss = (weights[:, None] * (pred - sampler.lookup(coords)).square()).mean()
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+        steps += 1
+
+    with torch.no_grad():
+        mse = F.mse_loss(model.forward_encoded(pixel_enc).clamp(0, 1), image)
+    return steps, -10.0 * torch.log10(mse).item()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--device", type=str, choices=["cpu", "cuda"], default="cpu")
+    parser.add_argument("--res", type=int, default=512)
+    parser.add_argument("--image", type=str, default="data/mit.jpg")
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--batch_size", type=int, default=16384)
+    args = parser.parse_args()
+
+    image = load_image(args.image, args.res, args.device)
+    for sampling in ["full image", "uniform", "error-driven"]:
+        steps, psnr = train(image, sampling, args.batch_size, args.seconds, args.device)
+        print(f"{sampling:>12}: {steps:6d} steps, PSNR: {psnr:.2f} dB")
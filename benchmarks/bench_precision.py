@@ -0,0 +1,92 @@
+"""
+Trains the neural field of 05_neural_field.py (full image, cached encoding) in
+float32 and under bfloat16 autocast for the same number of steps: reports the
+throughput, the memory saved for the backward pass and the final PSNR.
+The bfloat16 PSNR is checked against the float32 one (`--tolerance`, in dB).
+
+Run from the root of the repo:
+    python -m benchmarks.bench_precision --resolutions 256 512 1024
+"""
+
+import time
+from argparse import ArgumentParser
+
+import torch
+import torch.nn.functional as F
+
+from utils.images import load_image
+from utils.mlp_field import MlpField, PRECISIONS, autocast, normalized_pixel_grid
+
+LR = 5e-3
+
+
+def saved_bytes(fn) -> int:
+    """
+    Bytes of the (distinct) tensors saved for the backward pass while running `fn`
+    """
+    storages = {}
+
+    def pack(t):
+        storages[t.untyped_storage().data_ptr()] = t.untyped_storage().nbytes()
+        return t
+
+    with torch.autograd.graph.saved_tensors_hooks(pack, lambda t: t):
+        fn()
+    return sum(storages.values())
+
+
+def train(image, precision: str, steps: int, device: str):
+    torch.manual_seed(0)
+    model = MlpField(
+        input_dim=2, output_dim=3, pe_freqs=8, num_layers=2, hidden_dim=64
+    ).to(device)
+    optimizer = torch.optim.Adam(model.parameters(), lr=LR)
+    pixel_pos = normalized_pixel_grid(*image.shape[:2], device=device).reshape(-1, 2)
+    target = image.reshape(-1, 3)
+    with torch.no_grad():
+        pixel_enc = model.encode(pixel_pos)
+
+    def forward():
+        with autocast(device, precision):
+            pred = model.forward_encoded(pixel_enc)
+        # (the loss is computed in float32)
+        return F.mse_loss(pred.float(), target)
+
+    memory = saved_bytes(forward)
+
+    start = time.perf_counter()
+    for _ in range(steps):
+        loss = forward()
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+    loss.item()
+    elapsed = time.perf_counter() - start
+
+    with torch.no_grad():
+        mse = F.mse_loss(model.forward_encoded(pixel_enc).clamp(0, 1), target)
+    return steps / elapsed, memory, -10.0 * torch.log10(mse).item()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--device", type=str, choices=["cpu", "cuda"], default="cpu")
+    parser.add_argument("--resolutions", type=int, nargs="+", default=[256, 512, 1024])
+    parser.add_argument("--image", type=str, default="data/mit.jpg")
+    parser.add_argument("--steps", type=int, default=100)
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    args = parser.parse_args()
+
+    for res in args.resolutions:
+        image = load_image(args.image, res, args.device)
+        results = {}
+        for precision in PRECISIONS:
+            results[precision] = train(image, precision, args.steps, args.device)
+            rate, memory, psnr = results[precision]
+            print(
+                f"res {res:4d} {precision:>8}: {rate:6.2f} steps/s, "
+                f"saved activations {memory / 2**20:7.1f} MiB, PSNR {psnr:.2f} dB"
+            )
+        psnr_gap = results["float32"][2] - results["bfloat16"][2]
+        status = "OK" if psnr_gap <= args.tolerance else "FAILED"
+        print(f"res {res:4d}  bfloat16 PSNR gap: {psnr_gap:+.2f} dB ({status})")
@@ -0,0 +1,78 @@
+"""
+Compares the NumPy, torch and Dr.Jit backends of VoxelSpringSimulator:
+checks that they agree with the NumPy path and reports steps/sec.
+
+Run from the root of the repo:
+    python -m benchmarks.bench_spring_backends --res 64
+"""
+
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+
+from utils.voxel_spring_simulator import VoxelSpringSimulator
+
+
+def ball_coords(res: int) -> np.ndarray:
+    """Integer coordinates of a voxelized ball (a stand-in for a solid voxelized mesh)"""
+    grid = np.indices((res, res, res)) - res / 2 + 0.5
+    return np.argwhere(np.linalg.norm(grid, axis=0) < res / 2)
+
+
+def make_sim(coords, backend, dtype, batch_size):
+    init_pos = coords.astype(float)
+    init_pos[:, 0] *= 1.2
+    return VoxelSpringSimulator(
+        coords=coords,
+        init_positions=init_pos,
+        stiffness=500.0,
+        damping=0.1,
+        gravity=[0, -9.81, 0],
+        fixed=np.nonzero(coords[:, 1] == coords[:, 1].max())[0],
+        batch_size=batch_size,
+        dtype=dtype,
+        backend=backend,
+    )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--res", type=int, default=64)
+    parser.add_argument("--steps", type=int, default=100)
+    parser.add_argument("--batch_size", type=int, default=None)
+    parser.add_argument(
+        "--dtype", type=str, choices=["float32", "float64"], default="float32"
+    )
+    parser.add_argument("--backends", nargs="+", default=["numpy", "torch", "drjit"])
+    args = parser.parse_args()
+
+    coords = ball_coords(args.res)
+    dtype = np.dtype(args.dtype)
+    dt = 0.01
+    print(f"{len(coords)} voxels, batch size: {args.batch_size}, dtype: {dtype}")
+
+    # Reference trajectory
+    ref = make_sim(coords, "numpy", dtype, args.batch_size)
+    for _ in range(args.steps):
+        ref.step(dt)
+
+    for backend in args.backends:
+        try:
+            sim = make_sim(coords, backend, dtype, args.batch_size)
+        except ImportError as e:
+            print(f"{backend:>6}: unavailable ({e})")
+            continue
+
+        # Warm up (e.g., kernel compilation) and check correctness
+        sim.step(dt)
+        start = time.perf_counter()
+        for _ in range(args.steps - 1):
+            sim.step(dt)
+        elapsed = time.perf_counter() - start
+
+        error = np.abs(sim.x - ref.x).max() / np.abs(ref.x).max()
+        print(
+            f"{backend:>6}: {(args.steps - 1) / elapsed:8.1f} steps/s, "
+            f"max relative error vs numpy: {error:.2e}"
+        )
@@ -0,0 +1,109 @@
+"""
+Compares holding a large target image as a dense float32 tensor (as 05_neural_field.py
+does) with the memory-mapped TiledImage: startup time and peak memory (each measured
+in a separate process), and the cost of looking up minibatch targets.
+
+Run from the root of the repo (a synthetic image of --size x --size pixels is
+generated in --workdir if --image isn't given):
+    python -m benchmarks.bench_tiled_image --size 8192
+"""
+
+import multiprocessing
+import os
+import resource
+import shutil
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+from PIL import Image
+
+from utils.images import load_image
+from utils.pixel_sampler import PixelSampler
+from utils.tiled_image import TiledImage
+
+
+def synthetic_image(path: str, size: int):
+    """Smooth gradients plus noise (compresses like a photo, not like a flat image)"""
+    Image.MAX_IMAGE_PIXELS = None
+    rows = []
+    rng = np.random.default_rng(0)
+    x = np.linspace(0, 8 * np.pi, size, dtype=np.float32)
+    for start in range(0, size, 1024):
+        y = x[start : start + 1024, None]
+        base = 127 + 60 * np.sin(x[None] + y) + 40 * np.cos(3 * x[None] - y)
+        noise = rng.normal(0, 8, (len(y), size)).astype(np.float32)
+        channel = np.clip(base + noise, 0, 255).astype(np.uint8)
+        rows.append(np.stack([channel, channel[:, ::-1], 255 - channel], -1))
+    Image.fromarray(np.concatenate(rows)).save(path, quality=90)
+
+
+def measure(fn, *args):
+    """Run `fn` in a new process: returns (seconds, peak RSS in MiB)"""
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(timed, (fn, *args))
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    elapsed = time.perf_counter() - start
+    return elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def load_dense(path: str, size: int):
+    load_image(path, size)
+
+
+def open_tiled(path: str, cache_dir: str, res: int):
+    tiles = TiledImage.open(path, cache_dir=cache_dir)
+    tiles.resized(res)
+    tiles.thumbnail()
+
+
+def lookup_time(sampler, batch_size: int, repeats: int = 20) -> float:
+    start = time.perf_counter()
+    for _ in range(repeats):
+        coords, _ = sampler.sample(batch_size)
+        sampler.lookup(coords)
+    return 1000 * (time.perf_counter() - start) / repeats
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--image", type=str, default=None)
+    parser.add_argument("--size", type=int, default=8192)
+    parser.add_argument("--res", type=int, default=256)
+    parser.add_argument("--batch_size", type=int, default=16384)
+    parser.add_argument("--workdir", type=str, default="cache/bench_tiled_image")
+    args = parser.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+    path = args.image or os.path.join(args.workdir, f"synthetic_{args.size}.jpg")
+    if not os.path.exists(path):
+        synthetic_image(path, args.size)
+    cache_dir = os.path.join(args.workdir, "tiles")
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+    with Image.open(path) as image:
+        size = min(image.size)
+    print(f"{path}: {size}x{size} ({size * size / 1e6:.0f} Mpx)")
+    print(f"{'baseline process':>22}: {measure(timed, time.sleep, 0)[1]:7.0f} MiB")
+    for name, fn, fn_args in [
+        ("dense float32", load_dense, (path, size)),
+        ("tiled (build cache)", open_tiled, (path, cache_dir, args.res)),
+        ("tiled (cached)", open_tiled, (path, cache_dir, args.res)),
+    ]:
+        elapsed, peak = measure(fn, *fn_args)
+        print(f"{name:>22}: {elapsed:6.2f} s, peak RSS {peak:7.0f} MiB")
+
+    # Minibatch target lookups (uniform sampling)
+    tiles = TiledImage.open(path, cache_dir=cache_dir)
+    small = tiles.resized(args.res)
+    for name, sampler in [
+        ("tiled, 16 tiles/batch", PixelSampler(small, tiles=tiles)),
+        ("tiled, scattered", PixelSampler(small, tiles=tiles, tiles_per_batch=10**6)),
+    ]:
+        print(f"{name:>22}: {lookup_time(sampler, args.batch_size):6.2f} ms/batch")
+    dense = PixelSampler(load_image(path, size))
+    print(f"{'dense float32':>22}: {lookup_time(dense, args.batch_size):6.2f} ms/batch")
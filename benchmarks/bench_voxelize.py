@@ -0,0 +1,76 @@
+"""
+Compares the voxelization methods of `mesh_to_voxel_grid_indices` on the bundled meshes:
+trimesh ('subdivide', 'ray'), filled with scipy ('scipy') and the vectorized
+solid ('parity') / surface ('sat') voxelizers, and the sparse
+(run-length encoded) parity voxelizer ('parity_runs'). Reports the time and number of voxels,
+and the agreement of the solid methods.
+
+Run from the root of the repo:
+    python -m benchmarks.bench_voxelize --resolutions 32 64 128 256 512
+"""
+
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+import trimesh
+
+from utils.voxelize import mesh_to_voxel_grid_indices, mesh_to_sparse_voxels
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument(
+        "--meshes",
+        nargs="+",
+        default=["data/bunny.obj", "data/suzanne.ply", "data/teapot.ply"],
+    )
+    parser.add_argument(
+        "--resolutions", nargs="+", type=int, default=[32, 64, 128, 256, 512]
+    )
+    parser.add_argument(
+        "--methods",
+        nargs="+",
+        default=["subdivide", "ray", "scipy", "parity", "sat", "parity_runs"],
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=60.0,
+        help="skip higher resolutions of a method once it takes longer than this (s)",
+    )
+    args = parser.parse_args()
+
+    for path in args.meshes:
+        mesh = trimesh.load(path)
+        print(f"{path}: {len(mesh.faces)} triangles, watertight: {mesh.is_watertight}")
+        too_slow = set()
+        for res in args.resolutions:
+            occupancies = {}
+            for method in args.methods:
+                if method in too_slow:
+                    print(f"  {res:>4} {method:>9}: skipped")
+                    continue
+                start = time.perf_counter()
+                if method == "parity_runs":
+                    indices, _ = mesh_to_sparse_voxels(mesh, res)
+                else:
+                    occupancy, indices = mesh_to_voxel_grid_indices(mesh, res, method)
+                    occupancies[method] = occupancy
+                elapsed = time.perf_counter() - start
+                if elapsed > args.timeout:
+                    too_slow.add(method)
+                print(
+                    f"  {res:>4} {method:>9}: {elapsed:8.3f} s, {len(indices)} voxels"
+                )
+
+            # Agreement of the solid voxelizations (IoU, on the common grid)
+            if "scipy" in occupancies and "parity" in occupancies:
+                a, b = occupancies["scipy"], occupancies["parity"]
+                shape = np.minimum(a.shape, b.shape)
+                a, b = (
+                    a[: shape[0], : shape[1], : shape[2]],
+                    b[: shape[0], : shape[1], : shape[2]],
+                )
+                print(
+                    f"  {res:>4} IoU(scipy, parity): {(a & b).sum() / (a | b).sum():.3f}"
+                )
@@ -7,14 +7,20 @@ import gpytoolbox
 
 from ps_utils.viewer.base_viewer import BaseViewer
 from ps_utils.ui.save_utils import check_extension
+from ps_utils.ui.buttons import state_button
 from ps_utils.structures.voxel_set import VoxelSet
 
 BASIC_MESH_EXTENSIONS = {".ply", ".obj", ".stl"}
 
 from utils.voxel_spring_simulator import VoxelSpringSimulator
-from utils.voxelize import mesh_to_voxel_grid_indices
+from utils.voxelize import trilinear_embedding
+from utils.voxel_cache import VoxelCache
+from utils.step_scheduler import FixedStepScheduler
+from utils.trajectory import TrajectoryWriter, TrajectoryReader
+from utils.display_lod import spring_lod, LOD_MODES
 
 VOXEL_RES = 20
+SIM_BACKENDS = ["numpy", "torch", "drjit"]
 
 
 class SpringySimulation(BaseViewer):
@@ -27,6 +33,47 @@ class SpringySimulation(BaseViewer):
         self.dt = 0.02
         self.stiffness = 500.0
         self.dampening = 0.1
+        self.float32 = False
+        self.backend = "numpy"
+
+        # Fixed-timestep scheduler (decouples simulated time from the frame rate)
+        self.scheduler = FixedStepScheduler(frame_dt=self.dt, substeps=1)
+        self.simulating = True
+
+        # Level of detail: display a subset of the springs while simulating
+        # (the full network is displayed when paused)
+        self.lod = True
+        self.lod_max_edges = 20000
+        self.lod_mode = "stride"
+        self.lod_cache = {}
+        self.display_full = False
+
+        # Ensemble (batched) simulation, sweeping stiffness x dampening
+        self.ensemble_size = 1
+        self.ensemble_side_by_side = True
+        self.ensemble_member = 0
+
+        # Collisions
+        self.ground = False
+        self.ground_height = -5.0
+        self.self_collision = False
+
+        # Deform the loaded (fine) mesh with the (coarse) simulation
+        self.embed_mesh = False
+        self.ps_embedded_mesh = None
+
+        # Trajectory recording / playback
+        self.record_path = "recordings/springy"
+        self.record_float16 = True
+        self.record_delta = True
+        self.recorder = None
+        self.playback = None
+        self.playback_frame = 0
+        self.playback_playing = True
+        self.playback_loop = True
+
+        # On-disk cache of voxelizations (skips re-voxelizing already loaded meshes)
+        self.voxel_cache = VoxelCache()
 
         # Load a mesh when starting the viewer
         self.load_mesh("data/bunny.obj")
@@ -43,15 +90,162 @@ class SpringySimulation(BaseViewer):
 
         psim.SeparatorText("Simulation Parameters")
 
+        _, self.simulating = state_button(self.simulating, "Pause", "Simulate")
+
         _, self.dt = psim.SliderFloat("dt", self.dt, v_min=0.005, v_max=0.02)
-        _, self.stiffness = psim.SliderFloat(
-            "stiffness", self.stiffness, v_min=10.0, v_max=1000.0
+        self.scheduler.frame_dt = self.dt
+        _, self.scheduler.substeps = psim.SliderInt(
+            "substeps", self.scheduler.substeps, v_min=1, v_max=32
         )
-        reinitialize_simulation |= psim.IsItemDeactivatedAfterEdit()
-        _, self.dampening = psim.SliderFloat(
-            "dampening", self.dampening, v_min=0.0, v_max=1.0
+        _, self.scheduler.budget_ms = psim.SliderFloat(
+            "budget (ms)", self.scheduler.budget_ms, v_min=1.0, v_max=50.0
+        )
+        _, self.scheduler.realtime = psim.Checkbox("real-time", self.scheduler.realtime)
+        if self.scheduler.realtime:
+            psim.SameLine()
+            _, self.scheduler.time_scale = psim.SliderFloat(
+                "time scale", self.scheduler.time_scale, v_min=0.1, v_max=2.0
+            )
+        psim.Text(
+            f"Real-time factor: {self.scheduler.realtime_factor:.2f} "
+            f"({self.scheduler.steps_last_frame} steps, {self.scheduler.compute_ms:.1f} ms)"
+        )
+
+        # Parameters are updated in place: no need to restart the simulation
+        if self.sim.B is None:
+            changed, self.stiffness = psim.SliderFloat(
+                "stiffness", self.stiffness, v_min=10.0, v_max=1000.0
+            )
+            if changed:
+                self.sim.set_stiffness(self.stiffness)
+            changed, self.dampening = psim.SliderFloat(
+                "dampening", self.dampening, v_min=0.0, v_max=1.0
+            )
+            if changed:
+                self.sim.set_damping(self.dampening)
+        else:
+            # (the ensemble sweeps its own parameters, see `init_ensemble`)
+            psim.Text("Stiffness and dampening: swept by the ensemble")
+        changed, self.float32 = psim.Checkbox("float32", self.float32)
+        reinitialize_simulation |= changed
+        if psim.BeginCombo("backend", self.backend):
+            for backend in SIM_BACKENDS:
+                clicked, _ = psim.Selectable(backend, self.backend == backend)
+                if clicked and backend != self.backend:
+                    self.backend = backend
+                    reinitialize_simulation = True
+            psim.EndCombo()
+
+        # ========================
+        # ENSEMBLE
+        # ========================
+
+        psim.SeparatorText("Ensemble")
+
+        _, self.ensemble_size = psim.SliderInt(
+            "ensemble size", self.ensemble_size, v_min=1, v_max=64
         )
         reinitialize_simulation |= psim.IsItemDeactivatedAfterEdit()
+        if self.sim.B is not None:
+            changed, self.ensemble_side_by_side = psim.Checkbox(
+                "side by side", self.ensemble_side_by_side
+            )
+            self.display_full &= not changed
+            if not self.ensemble_side_by_side:
+                changed, self.ensemble_member = psim.SliderInt(
+                    "member", self.ensemble_member, v_min=0, v_max=self.sim.B - 1
+                )
+                self.display_full &= not changed
+                psim.Text(
+                    f"stiffness: {self.sim.k[self.ensemble_member]:.1f}, "
+                    f"dampening: {self.sim.damping[self.ensemble_member]:.2f}"
+                )
+
+        # ========================
+        # DISPLAY
+        # ========================
+
+        psim.SeparatorText("Display")
+
+        changed, self.embed_mesh = psim.Checkbox("embedded mesh", self.embed_mesh)
+        if changed and not self.embed_mesh:
+            ps.remove_surface_mesh("embedded mesh", error_if_absent=False)
+            self.ps_embedded_mesh = None
+
+        _, self.lod = psim.Checkbox("level of detail", self.lod)
+        if self.lod:
+            _, self.lod_max_edges = psim.SliderInt(
+                "max springs", self.lod_max_edges, v_min=1000, v_max=200000
+            )
+            if psim.BeginCombo("LOD mode", self.lod_mode):
+                for mode in LOD_MODES:
+                    clicked, _ = psim.Selectable(mode, self.lod_mode == mode)
+                    if clicked:
+                        self.lod_mode = mode
+                psim.EndCombo()
+
+        # ========================
+        # COLLISIONS
+        # ========================
+
+        psim.SeparatorText("Collisions")
+
+        update_collisions = False
+        changed, self.ground = psim.Checkbox("ground", self.ground)
+        update_collisions |= changed
+        if self.ground:
+            psim.SameLine()
+            changed, self.ground_height = psim.SliderFloat(
+                "height", self.ground_height, v_min=-20.0, v_max=0.0
+            )
+            update_collisions |= changed
+        changed, self.self_collision = psim.Checkbox(
+            "self-collisions", self.self_collision
+        )
+        update_collisions |= changed
+        if update_collisions:
+            self.update_collisions()
+        if self.sim.collisions is not None:
+            psim.Text(
+                f"{self.sim.num_contacts} contacts ({self.sim.collision_ms:.1f} ms)"
+            )
+
+        # ========================
+        # RECORDING
+        # ========================
+
+        psim.SeparatorText("Recording")
+
+        _, self.record_path = psim.InputText("path", self.record_path)
+        if self.recorder is None:
+            if psim.Button("Record"):
+                self.start_recording()
+            psim.SameLine()
+            _, self.record_float16 = psim.Checkbox("float16", self.record_float16)
+            psim.SameLine()
+            _, self.record_delta = psim.Checkbox("delta", self.record_delta)
+        else:
+            if psim.Button("Stop recording"):
+                self.stop_recording()
+            psim.SameLine()
+            psim.Text(f"{self.recorder.num_frames} frames")
+
+        if self.playback is None:
+            if psim.Button("Play recording"):
+                self.start_playback()
+        else:
+            if psim.Button("Back to simulation"):
+                self.playback = None
+                self.lod_cache = {}
+            psim.SameLine()
+            _, self.playback_playing = state_button(
+                self.playback_playing, "Pause", "Play"
+            )
+            psim.SameLine()
+            _, self.playback_loop = psim.Checkbox("loop", self.playback_loop)
+            _, self.playback_frame = psim.SliderInt(
+                "frame", self.playback_frame, v_min=0, v_max=len(self.playback) - 1
+            )
 
         if reinitialize_simulation:
             self.init_simulation(
@@ -63,27 +257,40 @@ class SpringySimulation(BaseViewer):
         # VOXELSET
         # ========================
 
+        # Only the boundary conditions change: keep the current state
         if self.voxel_set.gui():
-            self.init_simulation(
-                coords=self.voxel_set.coords,
-                selection_mask=self.voxel_set.selection_mask,
-                keep_voxelset=True,
-            )
+            self.sim.set_fixed(self.voxel_set.selection_mask)
 
     def step(self):
-        # Step the simulation
-        self.simulation_step()
+        # Step the simulation (or replay a recording, without touching the simulator)
+        if self.playback is not None:
+            self.playback_step()
+        elif self.simulating:
+            self.simulation_step()
+        elif not self.display_full:
+            # Paused: display the full network (once, nothing moves)
+            self.update_structures(self.display_points(), self.display_edges())
+            self.display_full = True
 
     def simulation_step(self):
-        # Step the simulation
-        self.sim.step(self.dt)
+        # Step the simulation (possibly several substeps per frame)
+        self.scheduler.advance(self.sim.step)
+        if self.recorder is not None:
+            self.recorder.append(self.sim.x)
 
-        # Update the point cloud and edges
-        self.ps_pointcloud = ps.register_point_cloud(
-            "points",
-            self.sim.x,
+        # Deform the loaded mesh with the simulation
+        self.update_embedded_mesh()
+
+        # Only once per frame, after all substeps
+        self.update_structures(
+            *self.apply_lod(self.display_points(), self.display_edges())
         )
-        self.ps_edges = ps.register_curve_network("springs", self.sim.x, self.sim.edges)
+        self.display_full = False
+
+    def update_structures(self, points: np.ndarray, edges: np.ndarray):
+        # Update the point cloud and edges
+        self.ps_pointcloud = ps.register_point_cloud("points", points)
+        self.ps_edges = ps.register_curve_network("springs", points, edges)
 
     def init_simulation(
         self,
@@ -94,6 +301,10 @@ class SpringySimulation(BaseViewer):
         """
         Initialize the simulation
         """
+        # The recording (if any) holds the previous topology: close it
+        if self.recorder is not None:
+            self.stop_recording()
+
         # Slightly offset initial positions to create jiggly patterns
         init_pos = coords.copy().astype(float)
         init_pos[:, 0] *= 1.2
@@ -103,16 +314,29 @@ class SpringySimulation(BaseViewer):
             selection_mask = coords[:, 1] == coords[:, 1].max()
         fixed_ids = np.nonzero(selection_mask)[0]
 
+        # Sweep parameters over the ensemble (if any)
+        if self.ensemble_size > 1:
+            stiffness, dampening = self.init_ensemble(coords)
+        else:
+            stiffness, dampening = self.stiffness, self.dampening
+
         # Create the simulator
         self.sim = VoxelSpringSimulator(
             coords=coords,
             init_positions=init_pos,
-            stiffness=self.stiffness,
+            stiffness=stiffness,
             mass=1.0,
-            damping=self.dampening,
+            damping=dampening,
             gravity=[0, -9.81, 0],
             fixed=fixed_ids,
+            batch_size=self.ensemble_size if self.ensemble_size > 1 else None,
+            dtype=np.float32 if self.float32 else np.float64,
+            backend=self.backend,
         )
+        self.scheduler.reset()
+        self.update_collisions()
+        self.lod_cache = {}
+        self.display_full = False
 
         # This creates a selectable voxel set, useful to manually select voxels
         if not keep_voxelset:
@@ -126,6 +350,152 @@ class SpringySimulation(BaseViewer):
                 name="Boundary Conditions",
             )
 
+    def playback_step(self):
+        """
+        Display the current frame of the recording and move to the next one
+        """
+        frame = self.playback[self.playback_frame]
+        edges = self.playback.edges
+        if frame.ndim == 3:
+            # Ensemble: lay the members out side by side, as when recording
+            offsets = np.array(
+                self.playback.attrs.get("offsets", np.zeros((len(frame), 3)))
+            )
+            points = (frame + offsets[:, None]).reshape(-1, 3)
+            edges = (
+                edges[None] + frame.shape[1] * np.arange(len(frame))[:, None, None]
+            ).reshape(-1, 2)
+        else:
+            points = frame
+        if self.playback_playing:
+            points, edges = self.apply_lod(points, edges)
+        self.update_structures(points, edges)
+
+        if self.playback_playing:
+            if self.playback_loop:
+                self.playback_frame = (self.playback_frame + 1) % len(self.playback)
+            else:
+                self.playback_frame = min(
+                    self.playback_frame + 1, len(self.playback) - 1
+                )
+
+    def apply_lod(self, points: np.ndarray, edges: np.ndarray) -> tuple:
+        """
+        Subsample the displayed springs (and the points they use), if enabled.
+        The subset is computed once per topology and cached.
+        """
+        if not self.lod or len(edges) <= self.lod_max_edges:
+            return points, edges
+        key = (len(points), len(edges), self.lod_max_edges, self.lod_mode)
+        if key not in self.lod_cache:
+            self.lod_cache[key] = spring_lod(edges, self.lod_max_edges, self.lod_mode)
+        point_ids, lod_edges = self.lod_cache[key]
+        return points[point_ids], lod_edges
+
+    def start_recording(self):
+        """
+        Stream the simulated positions (once per frame) to `self.record_path`
+        """
+        attrs = dict(dt=self.dt, substeps=self.scheduler.substeps)
+        if self.sim.B is not None:
+            attrs["offsets"] = self.ensemble_offsets.tolist()
+        self.recorder = TrajectoryWriter(
+            self.record_path,
+            edges=self.sim.edges,
+            float16=self.record_float16,
+            delta=self.record_delta,
+            attrs=attrs,
+        )
+
+    def stop_recording(self):
+        self.recorder.close()
+        self.recorder = None
+
+    def start_playback(self):
+        """
+        Replay the recording at `self.record_path` (memory-mapped, nothing is simulated)
+        """
+        if self.recorder is not None:
+            self.stop_recording()
+        try:
+            self.playback = TrajectoryReader(self.record_path)
+        except (OSError, ValueError) as e:
+            print(f"Couldn't load recording at: {self.record_path}")
+            return
+        if len(self.playback) == 0:
+            self.playback = None
+            return
+        self.playback_frame = 0
+        self.lod_cache = {}
+
+    def update_embedded_mesh(self):
+        """
+        Move the vertices of the loaded mesh with the simulated lattice (one SpMV)
+        """
+        if not self.embed_mesh or self.embedding.shape[1] != self.sim.N:
+            return
+        if self.sim.B is None:
+            x = self.sim.x
+        else:
+            x = self.sim.x[0 if self.ensemble_side_by_side else self.ensemble_member]
+        vertices = self.embedding @ x + self.embedding_offset
+        if self.ps_embedded_mesh is None:
+            self.ps_embedded_mesh = ps.register_surface_mesh(
+                "embedded mesh", vertices, self.mesh_faces
+            )
+        else:
+            self.ps_embedded_mesh.update_vertex_positions(vertices)
+
+    def update_collisions(self):
+        """
+        Pass the collision settings to the simulator
+        """
+        self.sim.set_collisions(
+            ground=([0.0, 1.0, 0.0], self.ground_height) if self.ground else None,
+            self_collision=self.self_collision,
+        )
+
+    def init_ensemble(self, coords: np.ndarray):
+        """
+        Lay out the ensemble members on a grid: stiffness varies along columns
+        and dampening along rows (over the ranges of the GUI sliders).
+        """
+        B = self.ensemble_size
+        n_cols = int(np.ceil(np.sqrt(B)))
+        n_rows = int(np.ceil(B / n_cols))
+        rows, cols = np.divmod(np.arange(B), n_cols)
+
+        stiffness = np.geomspace(10.0, 1000.0, n_cols)[cols]
+        dampening = np.linspace(0.0, 1.0, max(n_rows, 2))[rows]
+
+        # Side-by-side offsets (in the xz-plane)
+        spacing = 1.5 * (coords.max() + 1)
+        self.ensemble_offsets = spacing * np.stack(
+            [cols, np.zeros(B), rows], axis=-1
+        ).astype(float)
+        self.ensemble_member = min(self.ensemble_member, B - 1)
+
+        return stiffness, dampening
+
+    def display_points(self) -> np.ndarray:
+        """
+        Positions to display: the simulation, or the ensemble (side by side or a single member)
+        """
+        if self.sim.B is None:
+            return self.sim.x
+        if self.ensemble_side_by_side:
+            return (self.sim.x + self.ensemble_offsets[:, None]).reshape(-1, 3)
+        return self.sim.x[self.ensemble_member]
+
+    def display_edges(self) -> np.ndarray:
+        """
+        Edges matching `display_points`
+        """
+        if self.sim.B is None or not self.ensemble_side_by_side:
+            return self.sim.edges
+        offsets = self.sim.N * np.arange(self.sim.B)
+        return (self.sim.edges[None] + offsets[:, None, None]).reshape(-1, 2)
+
     def load_mesh(self, input_path: str):
         """
         Loads a mesh with Trimesh. Voxelizes it.
@@ -134,7 +504,17 @@ class SpringySimulation(BaseViewer):
         # Load the new grid coordinates
         mesh = trimesh.load(input_path)
         # Converts the mesh to voxels coordinates (i.e., integer coordinates of shape(n_coordinates, 3))
-        grid_coords = mesh_to_voxel_grid_indices(mesh, VOXEL_RES)[1]
+        # (cached on disk: loading the same file again skips the voxelization)
+        _, grid_coords, transform = self.voxel_cache.voxelize(
+            input_path, mesh, VOXEL_RES
+        )
+        # Embed the mesh vertices into the voxel lattice (trilinear weights, built once).
+        # The offset makes the embedding exact at rest, even when some corners are missing.
+        vertices = trimesh.transform_points(mesh.vertices, np.linalg.inv(transform))
+        self.embedding = trilinear_embedding(vertices, grid_coords)
+        self.embedding_offset = vertices - self.embedding @ grid_coords
+        self.mesh_faces = mesh.faces
+        self.ps_embedded_mesh = None
         # Initialize the simulation with them
         self.init_simulation(grid_coords)
 
@@ -1,11 +1,11 @@
-from collections import defaultdict
+import atexit
+import os
 from PIL import Image
 from argparse import ArgumentParser
 
 import numpy as np
 import torch
 import torch.nn.functional as F
-import torchvision.transforms as transforms
 
 import polyscope as ps
 import polyscope.imgui as psim
@@ -14,10 +14,34 @@ from ps_utils.viewer.base_viewer import BaseViewer
 from ps_utils.ui.key_handler import KEY_HANDLER
 from ps_utils.ui.buttons import state_button
 from ps_utils.ui.image_utils import Thumbnail
-from utils.mlp_field import MlpField, normalized_pixel_grid
+from utils.mlp_field import (
+    MlpField,
+    PRECISIONS,
+    autocast,
+    compile_field,
+    normalized_pixel_grid,
+)
+from utils.images import image_to_tensor
+from utils.pixel_sampler import PixelSampler
+from utils.tiled_image import TiledImage
+from utils.background_trainer import BackgroundTrainer
+from utils.field_renderer import FieldRenderer
+from utils.metrics import LossRecorder
+from utils.checkpoint import (
+    AsyncCheckpointer,
+    check_config,
+    load_checkpoint,
+    load_parameters,
+)
 
 LR = 5e-3
 NUM_ITERATIONS = 2500
+# Minibatch training: refresh the error map / the displayed image every ... steps
+ERROR_REFRESH = 50
+DISPLAY_REFRESH = 10
+SAMPLING_MODES = ["full image", "uniform", "error-driven"]
+# Checkpoint configuration fields that determine the shapes of the parameters
+MODEL_CONFIG = ("encoding",)
 WINDOW_SIZE = 900
 
 
@@ -26,17 +50,73 @@ class NeuralField(BaseViewer):
     Demo viewer showcasing image buffers and online neural field training.
     """
 
-    def post_init(self, device="cpu", res=256, image_path="data/mit.jpg", **kwargs):
+    def post_init(
+        self,
+        device="cpu",
+        res=256,
+        image_path="data/mit.jpg",
+        cache_encoding=True,
+        batch_size=16384,
+        sampling="full image",
+        encoding="frequency",
+        background=False,
+        compile="none",
+        precision="float32",
+        display_res=None,
+        checkpoint_path="checkpoints/neural_field.pt",
+        autosave_every=0,
+        resume=False,
+        warm_start=None,
+        tiled=False,
+        **kwargs,
+    ):
         # Set variables
         self.device = device
         self.res = res
         self.image_path = image_path
+        # Cache the positional encoding of the pixels (memory: res^2 x encoded dim)
+        self.cache_encoding = cache_encoding
+        # Train on all pixels, or on minibatches of `batch_size` (continuous) pixels
+        self.batch_size = batch_size
+        self.sampling = sampling
+        # Input encoding of the MLP: "frequency" or "hashgrid"
+        self.encoding = encoding
+        # Compile the MLP: "none", "torch.compile" or "torchscript"
+        self.compile = compile
+        self.compile_backend = "eager"
+        # Forward/backward in "float32" or under "bfloat16" autocast (float32 weights)
+        self.precision = precision
+        # Save the training state every `autosave_every` steps (0: never), in the background
+        self.checkpoint_path = checkpoint_path
+        self.autosave_every = autosave_every
+        self.checkpointer = AsyncCheckpointer()
+        # Initialize the model with the parameters of a checkpoint (e.g., another image)
+        self.warm_start = warm_start
+        # Keep the full-resolution image in a memory-mapped tile cache (huge images)
+        self.tiled = tiled
         # Override resolution to square-shaped
         ps.set_window_size(WINDOW_SIZE, WINDOW_SIZE)
+        # (set before resuming, which clears the losses queued by the trainer)
+        self.trainer = None
         # Initialize model and optimizer
         self.reset()
+        if resume and os.path.exists(self.checkpoint_path):
+            self.load_checkpoint()
+        # Display the (continuous) field at its own resolution, possibly zoomed in
+        display_res = display_res or self.res
+        self.renderer = FieldRenderer(display_res, display_res, device=self.device)
+        # View ((center, zoom)) requested by the GUI, applied by the rendering thread
+        self.view = (self.renderer.center, self.renderer.zoom)
+        self.rendered_view = self.view
         # Create a render buffer to display the result of optimization
         self.init_render_buffer()
+        # Optionally, train on a background thread (not limited by the frame rate)
+        if background:
+            self.trainer = BackgroundTrainer(self.training_step, self.render_display)
+            self.trainer.start()
+            self.trainer.send("train")
+            # (stop between two steps when the viewer exits)
+            atexit.register(self.trainer.close)
 
     def reset(self):
         """
@@ -46,18 +126,17 @@ class NeuralField(BaseViewer):
         """
 
         # Load the image
-        image = Image.open(self.image_path).convert("RGB")  # RGB only!
-        self.image = (
-            transforms.Compose(
-                [
-                    transforms.ToTensor(),
-                    transforms.CenterCrop(min(image.width, image.height)),
-                    transforms.Resize((self.res, self.res)),
-                ]
-            )(image)
-            .permute((1, 2, 0))
-            .to(self.device)
-        )  # Convert to Tensor
+        if self.tiled:
+            # Decoded once into a tile cache: the image (at `res`) and the thumbnail
+            # come from its pyramid, minibatch targets from its full-resolution tiles
+            self.tiles = TiledImage.open(self.image_path)
+            image = self.tiles.thumbnail()
+            self.image = self.tiles.resized(self.res).to(self.device)
+        else:
+            self.tiles = None
+            image = Image.open(self.image_path).convert("RGB")  # RGB only!
+            # Convert to Tensor (same preprocessing as 05_neural_field_batch.py)
+            self.image = image_to_tensor(image, self.res, self.device)
         self.height, self.width = self.image.shape[:2]
 
         # Create a GUI thumbnail
@@ -65,24 +144,128 @@ class NeuralField(BaseViewer):
 
         # Initialize model and optimizer
         self.model = MlpField(
-            input_dim=2, output_dim=3, pe_freqs=8, num_layers=2, hidden_dim=64
+            input_dim=2,
+            output_dim=3,
+            pe_freqs=8,
+            num_layers=2,
+            hidden_dim=64,
+            encoding=self.encoding,
+            # (the finest level matches the image resolution)
+            hashgrid_kwargs=dict(finest_resolution=self.res, log2_table_size=16),
         ).to(self.device)
+        if self.warm_start is not None:
+            state = load_checkpoint(self.warm_start)
+            # (the image may differ: only the shape of the model has to match)
+            check_config(state, self.checkpoint_config(), MODEL_CONFIG, self.warm_start)
+            load_parameters(self.model, state["model"])
         self.optimizer = torch.optim.Adam(self.model.parameters(), lr=LR)
+        self.optimizer_step = self.optimizer.step
+
+        # The network inputs never change: compute them once
+        # (flattened: compiled/traced models expect [B, D_in] inputs)
+        self.pixel_pos = normalized_pixel_grid(
+            self.height, self.width, device=self.device
+        ).reshape(-1, 2)
+
+        # Compile the encoder and the MLP (and the optimizer step)
+        if self.compile != "none":
+            self.compile_backend = compile_field(
+                self.model, self.pixel_pos, self.compile
+            )
+            if self.compile_backend == "torch.compile":
+                self.optimizer_step = torch.compile(self.optimizer.step)
+
+        self.pixel_enc = None
+        # (a hash grid is trained: its encoding can't be cached)
+        if self.cache_encoding and not self.model.trainable_encoding:
+            with torch.no_grad():
+                self.pixel_enc = self.model.encode(self.pixel_pos)
+
+        # Minibatch sampling (bilinear target lookups, error map)
+        self.sampler = PixelSampler(self.image, tiles=self.tiles)
+        self.pred = None
+        self.display_stale = True
+
         self.loss_fn = F.mse_loss
         self.i_step = 0
-        self.losses = defaultdict(lambda: [])
+        # (losses are fetched from the device every few steps, history is bounded)
+        self.losses = LossRecorder()
         self.optimizing = True
 
+    def reset_training(self):
+        """
+        Reset, after pausing the background trainer (if any): it must not step
+        while the model is replaced.
+        """
+        if self.trainer is None:
+            self.reset()
+            return
+        self.trainer.send("pause", wait=True)
+        self.trainer.losses.clear()
+        self.reset()
+        self.trainer.send("train")
+
+    def run_paused(self, fn):
+        """
+        Run `fn` after pausing the background trainer (if any), then resume training
+        """
+        if self.trainer is None:
+            fn()
+            return
+        training = self.optimizing
+        self.trainer.send("pause", wait=True)
+        try:
+            fn()
+        finally:
+            if training:
+                self.trainer.send("train")
+
+    def save_checkpoint(self):
+        """
+        Save the training state (written asynchronously: returns right away)
+        """
+        state = dict(
+            config=self.checkpoint_config(),
+            model=self.model.state_dict(),
+            optimizer=self.optimizer.state_dict(),
+            step=self.i_step,
+            losses=self.losses.state_dict(),
+        )
+        self.checkpointer.save(self.checkpoint_path, state)
+
+    def load_checkpoint(self):
+        """
+        Resume training from `checkpoint_path` (same image and model configuration)
+        """
+        self.checkpointer.wait()
+        state = load_checkpoint(self.checkpoint_path, self.device)
+        check_config(state, self.checkpoint_config(), path=self.checkpoint_path)
+        self.model.load_state_dict(state["model"])
+        self.optimizer.load_state_dict(state["optimizer"])
+        self.i_step = state["step"]
+        self.losses.load_state_dict(state["losses"])
+        if self.trainer is not None:
+            self.trainer.losses.clear()
+        self.pred = None
+        self.display_stale = True
+
+    def checkpoint_config(self) -> dict:
+        """
+        Configuration saved in checkpoints (and checked when loading them)
+        """
+        return dict(image_path=self.image_path, res=self.res, encoding=self.encoding)
+
     def init_render_buffer(self):
         """
         Placeholder code to initialize a Polyscope render buffer.
         Same as 03_cornell_box.
         """
 
+        height, width = self.renderer.height, self.renderer.width
         self.render_buffer_quantity = ps.add_raw_color_alpha_render_image_quantity(
             "render_buffer",
-            np.ones((self.height, self.width), dtype=float),
-            np.ones((self.height, self.width, 4), dtype=float),
+            np.ones((height, width), dtype=float),
+            np.ones((height, width, 4), dtype=float),
             enabled=True,
             allow_fullscreen_compositing=True,
         )
@@ -90,10 +273,19 @@ class NeuralField(BaseViewer):
         self.render_buffer = ps.get_quantity_buffer("render_buffer", "colors")
 
     def step(self):
-        if self.optimizing:
+        if self.trainer is not None:
+            # Training runs on its own thread: only collect the losses
+            while self.trainer.losses:
+                self.losses.record(self.trainer.losses.popleft())
+            # (stopped by itself when done)
+            if self.trainer.commands.empty():
+                self.optimizing = self.trainer.training
+        elif self.optimizing:
             self.optimizing, loss_dict = self.training_step()
-            for k, v in loss_dict.items():
-                self.losses[k].append(v)
+            self.losses.record(loss_dict)
+        # (show the last losses once training stops)
+        if not self.optimizing:
+            self.losses.flush()
 
     def gui(self):
         # Just calling super to get FPS
@@ -102,44 +294,138 @@ class NeuralField(BaseViewer):
         psim.SeparatorText("Optimization")
 
         psim.Text(f"Iteration: {self.i_step:03d}/{NUM_ITERATIONS:03d}")
+        if self.compile != "none":
+            psim.Text(f"Backend: {self.compile_backend}")
 
-        _, self.optimizing = state_button(self.optimizing, "Stop", "Train")
+        changed, self.optimizing = state_button(self.optimizing, "Stop", "Train")
+        if changed and self.trainer is not None:
+            self.trainer.send("train" if self.optimizing else "pause")
 
         psim.SameLine()
         # KEY_HANDLER automatically checks for key inputs.
         if psim.Button("Reset##training_viewer") or KEY_HANDLER("r"):
-            self.reset()
+            self.reset_training()
+
+        if psim.BeginCombo("sampling", self.sampling):
+            for mode in SAMPLING_MODES:
+                clicked, _ = psim.Selectable(mode, self.sampling == mode)
+                if clicked:
+                    self.sampling = mode
+            psim.EndCombo()
+        if self.sampling != "full image":
+            _, self.batch_size = psim.SliderInt(
+                "batch size", self.batch_size, v_min=1024, v_max=65536
+            )
+
+        if psim.Button("Save checkpoint"):
+            self.run_paused(self.save_checkpoint)
+        if os.path.exists(self.checkpoint_path):
+            psim.SameLine()
+            if psim.Button("Load checkpoint"):
+                try:
+                    self.run_paused(self.load_checkpoint)
+                except ValueError as e:
+                    print(f"Couldn't load checkpoint: {e}")
+
+        psim.SeparatorText("Display")
+
+        # (the background trainer may be rendering: only request the new view)
+        center, zoom = self.view
+        changed_zoom, zoom = psim.SliderFloat("zoom", zoom, v_min=1.0, v_max=16.0)
+        changed_x, center_x = psim.SliderFloat("center x", center[0], 0.0, 1.0)
+        changed_y, center_y = psim.SliderFloat("center y", center[1], 0.0, 1.0)
+        if changed_zoom or changed_x or changed_y:
+            self.view = ((center_x, center_y), zoom)
+            self.display_stale = True
+            if self.trainer is not None:
+                self.trainer.send("publish")
 
         psim.SeparatorText("Losses")
 
-        for k, v in self.losses.items():
+        for k in self.losses.names:
             psim.PlotLines(
                 f"{k}",
-                v,
+                self.losses.plots[k],
+                graph_size=(300, 100),
+                overlay_text=f"{k}: {self.losses.latest[k]:.2e}",
+            )
+            psim.PlotLines(
+                f"{k} (whole run)",
+                self.losses.history_plots[k],
                 graph_size=(300, 100),
-                overlay_text=f"{k}",
+                overlay_text=f"{k} (whole run)",
             )
 
         psim.SeparatorText("Target Image")
 
         self.thumbnail.gui()
 
+    def forward_pixels(self) -> torch.Tensor:
+        """
+        Predicted colors of all pixels [H, W, 3] (from the cached inputs)
+        """
+        with autocast(self.device, self.precision):
+            if self.pixel_enc is not None:
+                pred = self.model.forward_encoded(self.pixel_enc)
+            else:
+                pred = self.model(self.pixel_pos)
+        # (losses are computed in float32)
+        return pred.float().view(self.height, self.width, -1)
+
+    @torch.no_grad()
+    def predict(self) -> torch.Tensor:
+        return self.forward_pixels()
+
+    def query(self, coords: torch.Tensor) -> torch.Tensor:
+        """
+        Colors of the field at [K, 2] (x, y) coordinates in [0, 1]
+        """
+        with autocast(self.device, self.precision):
+            return self.model(coords).float()
+
+    @torch.no_grad()
+    def render_display(self) -> torch.Tensor:
+        """
+        [H, W, 4] RGBA image of the current view (at the display resolution)
+        """
+        renderer = self.renderer
+        view = self.view
+        if view != self.rendered_view:
+            renderer.set_view(*view)
+            self.rendered_view = view
+        if renderer.full_view and renderer.width == self.width:
+            # Same pixels as the training image: reuse the prediction, if any
+            # (minibatch training doesn't predict the full image)
+            if self.pred is None:
+                self.pred = self.predict()
+            return renderer.fill(self.pred)
+        # Otherwise, evaluate the field in chunks
+        return renderer.render(self.query)
+
     @torch.no_grad()
     def draw(self):
         """
         Take the current output of the MLP and pass it to the Polyscope render buffer.
         """
-        rendered_image = torch.cat(
-            [
-                self.pred.detach(),
-                torch.ones((self.height, self.width, 1), device=self.device),
-            ],
-            dim=-1,
-        )
+        if self.trainer is not None:
+            # (the trainer only publishes by itself while training: when paused, ask it
+            # to render, on its thread)
+            if self.display_stale and not self.optimizing:
+                self.trainer.send("publish")
+            self.display_stale = False
+            # Only upload the snapshots published by the trainer, when they change
+            self.trainer.snapshot.consume(self.upload)
+            return
+
+        if self.display_stale:
+            self.upload(self.render_display())
+            self.display_stale = False
+
+    def upload(self, rgba: torch.Tensor):
         if self.device == "cpu":
-            self.render_buffer.update_data_from_host(rendered_image.reshape(-1, 4))
+            self.render_buffer.update_data_from_host(rgba.view(-1, 4))
         else:
-            self.render_buffer.update_data_from_device(rendered_image)
+            self.render_buffer.update_data_from_device(rgba)
 
     def training_step(self):
         """
@@ -153,32 +439,130 @@ class NeuralField(BaseViewer):
         # Store all individual losses computed at this step, here only one
         loss_dict = {}
 
-        # Sample pixels
-        pixel_pos = normalized_pixel_grid(self.height, self.width, device=self.device)
-
-        # Infer the predicted color
-        self.pred = self.model(pixel_pos)
-        # Compute the loss
-        loss = self.loss_fn(self.pred, self.image)
+        if self.sampling == "full image":
+            # Infer the predicted color (of all pixels)
+            self.pred = self.forward_pixels()
+            # Compute the loss
+            loss = self.loss_fn(self.pred, self.image)
+            self.display_stale = True
+        else:
+            loss = self.minibatch_loss()
+            # Refresh the displayed image every few steps
+            if self.i_step % DISPLAY_REFRESH == 0:
+                self.pred = None
+                self.display_stale = True
 
         # Backward pass + Step
         self.optimizer.zero_grad()
         loss.backward()
-        self.optimizer.step()
-        loss_dict["total"] = loss.item()
+        self.optimizer_step()
+        # (no .item(): it would wait for the device at every step)
+        loss_dict["total"] = loss.detach()
 
         self.i_step += 1
+        if self.autosave_every > 0 and self.i_step % self.autosave_every == 0:
+            self.save_checkpoint()
 
         return self.i_step < NUM_ITERATIONS, loss_dict
 
+    def minibatch_loss(self) -> torch.Tensor:
+        """
+        Loss on `batch_size` pixels, sampled uniformly or where the error is high
+        (then weighted so that the loss is an unbiased estimate of the full-image MSE)
+        """
+        importance = self.sampling == "error-driven"
+        if importance and self.i_step % ERROR_REFRESH == 0:
+            self.sampler.update_errors(self.model)
+
+        coords, weights = self.sampler.sample(self.batch_size, importance)
+        with autocast(self.device, self.precision):
+            pred = self.model(coords).float()
+        target = self.sampler.lookup(coords)
+        return (weights[:, None] * (pred - target).square()).mean()
+
 
 if __name__ == "__main__":
     parser = ArgumentParser()
     parser.add_argument("--device", type=str, choices=["cpu", "cuda"], default="cpu")
     parser.add_argument("--res", type=int, default=256)
     parser.add_argument("--image", type=str, default="data/mit.jpg")
+    parser.add_argument(
+        "--no_cache_encoding",
+        action="store_true",
+        help="re-encode the pixel coordinates at every step (saves memory at high resolutions)",
+    )
+    parser.add_argument(
+        "--sampling", type=str, choices=SAMPLING_MODES, default="full image"
+    )
+    parser.add_argument("--batch_size", type=int, default=16384)
+    parser.add_argument(
+        "--background",
+        action="store_true",
+        help="train on a background thread (previews are published every few steps)",
+    )
+    parser.add_argument(
+        "--compile",
+        type=str,
+        choices=["none", "torch.compile", "torchscript"],
+        default="none",
+        help="compile the MLP (torch.compile caches its artifacts in cache/torch_compile)",
+    )
+    parser.add_argument(
+        "--precision",
+        type=str,
+        choices=PRECISIONS,
+        default="float32",
+        help="bfloat16: forward/backward under autocast, float32 weights and loss",
+    )
+    parser.add_argument(
+        "--display_res",
+        type=int,
+        default=None,
+        help="resolution at which the field is displayed (default: --res)",
+    )
+    parser.add_argument("--checkpoint", type=str, default="checkpoints/neural_field.pt")
+    parser.add_argument(
+        "--autosave_every",
+        type=int,
+        default=0,
+        help="save a checkpoint every ... steps (0: only when clicking on Save)",
+    )
+    parser.add_argument(
+        "--resume", action="store_true", help="resume training from --checkpoint"
+    )
+    parser.add_argument(
+        "--warm_start",
+        type=str,
+        default=None,
+        help="initialize the model from a checkpoint (e.g., trained on another image)",
+    )
+    parser.add_argument(
+        "--tiled",
+        action="store_true",
+        help="stream the full-resolution image from a tile cache (use with minibatch --sampling)",
+    )
+    parser.add_argument(
+        "--encoding", type=str, choices=["frequency", "hashgrid"], default="frequency"
+    )
 
     args = parser.parse_args()
 
     # To pass parameters to a BaseViewer, you need to name and set default because they come as `kwargs`.
-    NeuralField(device=args.device, res=args.res, image_path=args.image)
+    NeuralField(
+        device=args.device,
+        res=args.res,
+        image_path=args.image,
+        cache_encoding=not args.no_cache_encoding,
+        batch_size=args.batch_size,
+        sampling=args.sampling,
+        encoding=args.encoding,
+        background=args.background,
+        compile=args.compile,
+        precision=args.precision,
+        display_res=args.display_res,
+        checkpoint_path=args.checkpoint,
+        autosave_every=args.autosave_every,
+        resume=args.resume,
+        warm_start=args.warm_start,
+        tiled=args.tiled,
+    )
@@ -0,0 +1,171 @@
+import collections
+import queue
+import threading
+import time
+import traceback
+
+import torch
+
+
+class SnapshotBuffer:
+    """
+    Double buffer between a producer (e.g., a training thread) and the render thread:
+    snapshots are copied to the back buffer, which is then swapped with the front one.
+    The consumer only reads the front buffer, and only when it has changed.
+    """
+
+    def __init__(self):
+        self.buffers = [None, None]
+        self.front = 0
+        self.version = 0
+        self.consumed_version = 0
+        self.lock = threading.Lock()
+
+    def publish(self, tensor: torch.Tensor):
+        back = 1 - self.front
+        buffer = self.buffers[back]
+        if (
+            buffer is None
+            or buffer.shape != tensor.shape
+            or buffer.device != tensor.device
+        ):
+            buffer = self.buffers[back] = torch.empty_like(tensor)
+        # (nobody reads the back buffer: no need to lock while copying)
+        buffer.copy_(tensor)
+        with self.lock:
+            self.front = back
+            self.version += 1
+
+    def consume(self, fn) -> bool:
+        """
+        Calls `fn` on the front buffer if it changed since the last call, returns whether it did.
+        (the front buffer can't be swapped while `fn` runs)
+        """
+        with self.lock:
+            if self.version == self.consumed_version:
+                return False
+            fn(self.buffers[self.front])
+            self.consumed_version = self.version
+        return True
+
+
+class BackgroundTrainer:
+    """
+    Runs training steps continuously on a background thread (decoupled from the frame rate).
+
+    - `step_fn()` performs a training step and returns (keep_going, loss_dict),
+      loss dicts are queued in `losses` for the render thread to collect.
+    - `snapshot_fn()` returns a (detached) prediction, published to `snapshot`
+      every `publish_steps` steps or `publish_ms` milliseconds (whichever comes first).
+    - The thread is controlled through a (thread-safe) command queue:
+      "train", "pause", "publish" (a snapshot, now) and "stop" (see `send`).
+      `snapshot_fn` only runs on the thread: other threads request snapshots with
+      "publish" rather than calling it (or `publish`) themselves.
+    - If `step_fn` or `snapshot_fn` raises, the thread stops: the exception is kept in
+      `error` and re-raised by `send`.
+    """
+
+    def __init__(
+        self, step_fn, snapshot_fn, publish_steps: int = 10, publish_ms: float = 100.0
+    ):
+        self.step_fn = step_fn
+        self.snapshot_fn = snapshot_fn
+        self.publish_steps = publish_steps
+        self.publish_ms = publish_ms
+
+        self.snapshot = SnapshotBuffer()
+        self.losses = collections.deque()
+        self.commands = queue.Queue()
+        self.training = False
+        self.error = None
+        # (guards `error` against commands queued while the thread fails)
+        self.lock = threading.Lock()
+        self.processing = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def send(self, command: str, wait: bool = False):
+        """
+        Queue a command, optionally waiting for the thread to process it
+        (e.g., pause and wait before modifying the model from another thread)
+        """
+        done = threading.Event()
+        with self.lock:
+            self.raise_error()
+            self.commands.put((command, done))
+        if wait:
+            done.wait()
+            self.raise_error()
+
+    def raise_error(self):
+        if self.error is not None:
+            raise RuntimeError("The background trainer failed") from self.error
+
+    def close(self):
+        """
+        Stop the thread (e.g., at exit: otherwise, it is killed in the middle of a step)
+        """
+        if self.thread.is_alive() and self.error is None:
+            self.send("stop", wait=True)
+
+    def publish(self):
+        self.snapshot.publish(self.snapshot_fn())
+
+    def run(self):
+        try:
+            self.loop()
+        except Exception as error:
+            traceback.print_exc()
+            with self.lock:
+                self.error = error
+                self.training = False
+                # Release the threads waiting for a command (they re-raise `error`)
+                if self.processing is not None:
+                    self.processing.set()
+                while not self.commands.empty():
+                    self.commands.get()[1].set()
+
+    def loop(self):
+        steps = 0
+        last_publish = time.perf_counter()
+        while True:
+            # Process the commands (and wait for one when not training)
+            while True:
+                try:
+                    command, done = self.commands.get(block=not self.training)
+                except queue.Empty:
+                    break
+                self.processing = done
+                if command == "train":
+                    self.training = True
+                elif command == "pause":
+                    if self.training:
+                        self.publish()
+                    self.training = False
+                elif command == "publish":
+                    self.publish()
+                elif command == "stop":
+                    self.training = False
+                    done.set()
+                    return
+                else:
+                    raise ValueError(f"Unknown command: {command}")
+                done.set()
+                self.processing = None
+
+            keep_going, loss_dict = self.step_fn()
+            self.losses.append(loss_dict)
+            self.training = keep_going
+            steps += 1
+
+            elapsed_ms = 1000 * (time.perf_counter() - last_publish)
+            if (
+                steps >= self.publish_steps
+                or elapsed_ms >= self.publish_ms
+                or not keep_going
+            ):
+                self.publish()
+                steps = 0
+                last_publish = time.perf_counter()
@@ -0,0 +1,116 @@
+import os
+import threading
+
+import torch
+
+CHECKPOINT_VERSION = 1
+
+
+def copy_state(state):
+    """
+    Copy of a (nested) state: tensors are detached and copied to the CPU, so that the
+    copy can be serialized while training keeps modifying the originals
+    """
+    if isinstance(state, torch.Tensor):
+        return state.detach().to("cpu", copy=True)
+    if isinstance(state, dict):
+        return {k: copy_state(v) for k, v in state.items()}
+    if isinstance(state, (list, tuple)):
+        return type(state)(copy_state(v) for v in state)
+    return state
+
+
+def write_checkpoint(path: str, state: dict):
+    """
+    Save `state` to a single file (written next to it, then renamed: an interrupted
+    save never leaves a corrupted checkpoint)
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    torch.save(dict(state, version=CHECKPOINT_VERSION), tmp_path)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path: str, device="cpu") -> dict:
+    state = torch.load(path, map_location=device, weights_only=True)
+    if state.get("version") != CHECKPOINT_VERSION:
+        raise ValueError(f"Unsupported checkpoint version in {path}")
+    return state
+
+
+def check_config(state: dict, config: dict, keys=None, path: str = "checkpoint"):
+    """
+    Raise a ValueError naming the fields of `config` (or only `keys`) that differ from
+    the configuration saved in `state`
+    """
+    saved = state.get("config", {})
+    keys = config.keys() if keys is None else keys
+    differences = [
+        f"{key}: {saved.get(key)!r} (saved) vs {config[key]!r} (current)"
+        for key in keys
+        if saved.get(key) != config[key]
+    ]
+    if differences:
+        raise ValueError(
+            f"{path} was saved with a different configuration: "
+            + ", ".join(differences)
+        )
+
+
+def load_parameters(model: torch.nn.Module, state_dict: dict):
+    """
+    Warm start: load the parameters of `state_dict` (e.g., trained on another image)
+    into `model`, leaving its buffers (derived from its own configuration) untouched
+    """
+    parameters = dict(model.named_parameters())
+    missing = parameters.keys() - state_dict.keys()
+    if missing:
+        raise ValueError(f"Missing parameters: {sorted(missing)}")
+    with torch.no_grad():
+        for name, parameter in parameters.items():
+            parameter.copy_(state_dict[name])
+
+
+class AsyncCheckpointer:
+    """
+    Writes checkpoints on a background thread: `save` only copies the state (fast), the
+    serialization and the write happen while training continues.
+    If saves are requested faster than they are written, only the latest one is kept.
+    """
+
+    def __init__(self):
+        self.pending = None
+        self.busy = False
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def save(self, path: str, state: dict):
+        state = copy_state(state)
+        with self.condition:
+            self.pending = (path, state)
+            self.condition.notify_all()
+
+    def wait(self):
+        """
+        Block until all requested checkpoints are written
+        """
+        with self.condition:
+            while self.pending is not None or self.busy:
+                self.condition.wait()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.pending is None:
+                    self.condition.wait()
+                path, state = self.pending
+                self.pending = None
+                self.busy = True
+            try:
+                write_checkpoint(path, state)
+            except Exception as e:
+                print(f"Failed to save {path} ({type(e).__name__}: {e})")
+            with self.condition:
+                self.busy = False
+                self.condition.notify_all()
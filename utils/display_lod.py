@@ -0,0 +1,44 @@
+import numpy as np
+
+LOD_MODES = ["stride", "surface"]
+
+
+def spring_lod(
+    edges: np.ndarray, max_edges: int = 20000, mode: str = "stride"
+) -> tuple:
+    """
+    Select a subset of (at most `max_edges`) springs to display, computed once per topology.
+
+    Parameters
+    ----------
+    edges : np.ndarray of shape (E, 2)
+        Indices of the endpoints of each spring.
+    max_edges : int
+        Maximum number of springs to keep.
+    mode : str, {'stride', 'surface'}
+        'stride' keeps evenly spaced springs; 'surface' favors springs between
+        boundary points (i.e., with missing neighbours), which define the silhouette.
+
+    Returns
+    -------
+    point_ids : np.ndarray of shape (P,)
+        Indices of the points used by the selected springs.
+    lod_edges : np.ndarray of shape (E', 2)
+        Selected springs, indexing into `point_ids`.
+    """
+    E = len(edges)
+    if E <= max_edges:
+        keep = np.arange(E)
+    elif mode == "stride":
+        keep = np.arange(0, E, int(np.ceil(E / max_edges)))
+    elif mode == "surface":
+        # the fewer neighbours, the more important (stable sort keeps an even spread)
+        degree = np.bincount(edges.ravel())
+        importance = degree[edges].sum(axis=-1)
+        keep = np.sort(np.argsort(importance, kind="stable")[:max_edges])
+    else:
+        raise ValueError(f"Unknown LOD mode: {mode}")
+
+    # Only keep the points that are used, and reindex the springs accordingly
+    point_ids, lod_edges = np.unique(edges[keep], return_inverse=True)
+    return point_ids, lod_edges.reshape(-1, 2)
@@ -0,0 +1,75 @@
+import torch
+
+
+class FieldRenderer:
+    """
+    Evaluates a 2D field (e.g., an MlpField) at an arbitrary output resolution, over the
+    whole [0, 1]^2 domain or a zoomed crop, in chunks of rows (bounded memory) and into a
+    preallocated RGBA buffer with a constant alpha channel (no per-frame allocation of
+    the output).
+
+    Coordinates follow `normalized_pixel_grid`: with zoom 1, a `width` x `height` output
+    samples exactly the training pixels of an image of the same resolution.
+    """
+
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        chunk_size: int = 1 << 16,
+        device="cpu",
+    ):
+        """
+        width, height : output resolution
+        chunk_size    : (maximum) number of points evaluated at once
+        """
+        self.width = width
+        self.height = height
+        self.rows_per_chunk = max(1, chunk_size // width)
+
+        self.rgba = torch.ones((height, width, 4), device=device)
+        # (x, y) inputs of a chunk: x only changes with the view, y with the rows
+        self.coords = torch.empty((self.rows_per_chunk, width, 2), device=device)
+        self.xs = torch.empty(width, device=device)
+        self.ys = torch.empty(height, device=device)
+
+        self.center = (0.5, 0.5)
+        self.zoom = 1.0
+        self.set_view(self.center, self.zoom)
+
+    def set_view(self, center: tuple, zoom: float):
+        """
+        Look at the square of size 1 / `zoom` around `center` (moved to stay in [0, 1]^2)
+        """
+        self.zoom = max(float(zoom), 1.0)
+        half = 0.5 / self.zoom
+        self.center = tuple(min(max(float(c), half), 1.0 - half) for c in center)
+        for axis, samples in enumerate((self.xs, self.ys)):
+            lo = self.center[axis] - half
+            torch.linspace(lo, lo + 2.0 * half, len(samples), out=samples)
+        self.coords[..., 0] = self.xs
+
+    @property
+    def full_view(self) -> bool:
+        return self.zoom == 1.0
+
+    def fill(self, colors: torch.Tensor) -> torch.Tensor:
+        """
+        Copy [H, W, 3] colors (e.g., a prediction at the output resolution) into the buffer
+        """
+        self.rgba[..., :3] = colors.detach()
+        return self.rgba
+
+    @torch.no_grad()
+    def render(self, field) -> torch.Tensor:
+        """
+        field: callable mapping [K, 2] (x, y) coordinates to [K, 3] colors
+        Returns: the [H, W, 4] RGBA buffer (overwritten by the next call)
+        """
+        for start in range(0, self.height, self.rows_per_chunk):
+            stop = min(start + self.rows_per_chunk, self.height)
+            coords = self.coords[: stop - start]
+            coords[..., 1] = self.ys[start:stop, None]
+            colors = field(coords.view(-1, 2))
+            self.rgba[start:stop, :, :3] = colors.view(stop - start, self.width, 3)
+        return self.rgba
@@ -0,0 +1,52 @@
+import os
+
+import torch
+import torchvision.transforms as transforms
+from PIL import Image
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp")
+
+
+def list_images(directory: str) -> list:
+    """
+    Sorted paths of the images (by extension) in `directory`
+    """
+    return sorted(
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+
+def load_image(path: str, res: int, device="cpu") -> torch.Tensor:
+    """
+    RGB image at `path`, preprocessed as in `image_to_tensor`
+    """
+    return image_to_tensor(Image.open(path).convert("RGB"), res, device)
+
+
+def image_to_tensor(image: Image.Image, res: int, device="cpu") -> torch.Tensor:
+    """
+    Preprocessing of the targets of 05_neural_field.py: center-cropped to a square and
+    resized, returned as a [res, res, 3] tensor in [0, 1]
+    """
+    return (
+        transforms.Compose(
+            [
+                transforms.ToTensor(),
+                transforms.CenterCrop(min(image.width, image.height)),
+                transforms.Resize((res, res)),
+            ]
+        )(image)
+        .permute((1, 2, 0))
+        .to(device)
+    )
+
+
+def save_image(path: str, image: torch.Tensor):
+    """
+    Save a [H, W, 3] tensor in [0, 1] (clamped) as an 8-bit image
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    pixels = (image.detach().clamp(0, 1) * 255).round().byte().cpu().numpy()
+    Image.fromarray(pixels).save(path)
@@ -0,0 +1,193 @@
+import threading
+from collections import defaultdict
+
+import numpy as np
+import torch
+
+
+def minmax_decimate(values: np.ndarray, num_points: int) -> np.ndarray:
+    """
+    Reduce `values` to (at most) `num_points` by keeping the min and the max of
+    `num_points // 2` bins: unlike subsampling, spikes stay visible in plots.
+    """
+    if len(values) <= num_points:
+        return values
+    bins = num_points // 2
+    edges = np.linspace(0, len(values), bins + 1).astype(np.int64)[:-1]
+    decimated = np.empty(2 * bins, dtype=values.dtype)
+    decimated[0::2] = np.minimum.reduceat(values, edges)
+    decimated[1::2] = np.maximum.reduceat(values, edges)
+    return decimated
+
+
+class RingBuffer:
+    """
+    Fixed-size float32 buffer keeping the last `capacity` values
+    """
+
+    def __init__(self, capacity: int):
+        self.data = np.zeros(capacity, dtype=np.float32)
+        self.start = 0
+        self.size = 0
+
+    def extend(self, values: np.ndarray):
+        capacity = len(self.data)
+        values = values[-capacity:]
+        end = self.start + self.size
+        self.data[(end + np.arange(len(values))) % capacity] = values
+        self.size = min(self.size + len(values), capacity)
+        self.start = (end + len(values) - self.size) % capacity
+
+    def values(self) -> np.ndarray:
+        """
+        Stored values, oldest first
+        """
+        return np.roll(self.data, -self.start)[: self.size]
+
+
+class DownsampledHistory:
+    """
+    Whole-run history in at most `capacity` values: each one is the mean of `block`
+    consecutive values, `block` doubling (and the history being halved) when full.
+    """
+
+    def __init__(self, capacity: int):
+        self.data = np.zeros(capacity - capacity % 2, dtype=np.float32)
+        self.size = 0
+        self.block = 1
+        self.pending = np.zeros(0, dtype=np.float32)
+
+    def extend(self, values: np.ndarray):
+        capacity = len(self.data)
+        values = np.concatenate([self.pending, values])
+        while True:
+            n = min(len(values) // self.block, capacity - self.size)
+            means = values[: n * self.block].reshape(n, self.block).mean(axis=-1)
+            self.data[self.size : self.size + n] = means
+            self.size += n
+            values = values[n * self.block :]
+            if self.size < capacity:
+                break
+            # Full: merge pairs of blocks
+            half = capacity // 2
+            self.data[:half] = self.data.reshape(half, 2).mean(axis=-1)
+            self.size = half
+            self.block *= 2
+        self.pending = values
+
+    def values(self) -> np.ndarray:
+        return self.data[: self.size]
+
+
+class LossRecorder:
+    """
+    Records losses without synchronizing with the device at every step: losses are kept
+    as (detached) tensors and fetched all at once every `flush_every` steps.
+
+    Per loss, memory and plotting cost are bounded whatever the length of the run:
+    - the last `capacity` values are kept in a ring buffer, plotted with min/max
+      decimation (at most `plot_points` points),
+    - the whole run is kept in a downsampled history of `history_capacity` values.
+    Plots are only recomputed when flushing.
+
+    Recording, flushing and saving are thread-safe (e.g., a background trainer
+    autosaves while the render thread records and flushes).
+    """
+
+    def __init__(
+        self,
+        capacity: int = 4096,
+        flush_every: int = 32,
+        plot_points: int = 512,
+        history_capacity: int = 512,
+    ):
+        self.capacity = capacity
+        self.flush_every = flush_every
+        self.plot_points = plot_points
+        self.history_capacity = history_capacity
+        self.lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.pending = defaultdict(list)
+            self.num_pending = 0
+            self.recent = {}
+            self.history = {}
+            self.plots = {}
+            self.history_plots = {}
+            self.latest = {}
+
+    @property
+    def names(self) -> list:
+        return list(self.plots.keys())
+
+    def record(self, loss_dict: dict):
+        """
+        loss_dict: {name: scalar tensor or float} of a training step
+        """
+        with self.lock:
+            for name, value in loss_dict.items():
+                if isinstance(value, torch.Tensor):
+                    value = value.detach()
+                self.pending[name].append(value)
+            self.num_pending += 1
+            if self.num_pending >= self.flush_every:
+                self.flush()
+
+    def flush(self):
+        """
+        Fetch the pending losses (a single device sync) and refresh the plots
+        """
+        with self.lock:
+            for name, values in self.pending.items():
+                if not values:
+                    continue
+                values = torch.stack([torch.as_tensor(v) for v in values])
+                values = values.float().cpu().numpy()
+                if name not in self.recent:
+                    self.recent[name] = RingBuffer(self.capacity)
+                    self.history[name] = DownsampledHistory(self.history_capacity)
+                self.recent[name].extend(values)
+                self.history[name].extend(values)
+                self.refresh(name)
+            self.pending.clear()
+            self.num_pending = 0
+
+    def refresh(self, name: str):
+        recent = self.recent[name].values()
+        self.latest[name] = float(recent[-1])
+        # (lists: what PlotLines expects)
+        self.plots[name] = minmax_decimate(recent, self.plot_points).tolist()
+        self.history_plots[name] = self.history[name].values().tolist()
+
+    def state_dict(self) -> dict:
+        """
+        Flushed history (as lists, e.g., to be saved in a checkpoint)
+        """
+        with self.lock:
+            return {
+                name: dict(
+                    recent=self.recent[name].values().tolist(),
+                    history=self.history[name].values().tolist(),
+                    history_block=self.history[name].block,
+                    history_pending=self.history[name].pending.tolist(),
+                )
+                for name in self.recent
+            }
+
+    def load_state_dict(self, state: dict):
+        with self.lock:
+            self.clear()
+            for name, s in state.items():
+                self.recent[name] = RingBuffer(self.capacity)
+                self.recent[name].extend(np.asarray(s["recent"], dtype=np.float32))
+                history = DownsampledHistory(self.history_capacity)
+                values = np.asarray(s["history"], dtype=np.float32)
+                values = values[: len(history.data)]
+                history.data[: len(values)] = values
+                history.size = len(values)
+                history.block = s["history_block"]
+                history.pending = np.asarray(s["history_pending"], dtype=np.float32)
+                self.history[name] = history
+                self.refresh(name)
@@ -1,3 +1,7 @@
+import itertools
+import math
+import os
+
 import torch
 import torch.nn as nn
 
@@ -23,17 +27,154 @@ class PositionalEncoding(nn.Module):
         else:
             freq_bands = torch.linspace(1.0, 2.0 ** (num_freqs - 1), num_freqs)
         self.register_buffer("freq_bands", freq_bands)
+        # (input_dim, device, dtype) -> (projection, phase), see `projection`
+        self._projections = {}
+
+    def projection(self, input_dim: int, device, dtype) -> tuple:
+        """
+        Matrix P [D_in, D_out] and phase [D_out] such that sin(x @ P + phase) is the
+        encoding (cos(y) = sin(y + pi/2)), with identity columns for the raw input.
+        Built once per input dimension/device/dtype.
+        """
+        key = (input_dim, device, dtype)
+        if key not in self._projections:
+            K = len(self.freq_bands)
+            eye = torch.eye(input_dim, device=device, dtype=dtype)
+            freqs = self.freq_bands.to(device, dtype)
+            # [D_in, K, 2, D_in]: frequency k of dimension d, for both sin and cos
+            enc = eye[:, None, None, :] * freqs[None, :, None, None]
+            proj = enc.expand(-1, -1, 2, -1).reshape(input_dim, -1)
+            phase = torch.zeros(K, 2, input_dim, device=device, dtype=dtype)
+            phase[:, 1] = math.pi / 2
+            phase = phase.flatten()
+            if self.include_input:
+                proj = torch.cat((eye, proj), dim=-1)
+                phase = torch.cat((phase.new_zeros(input_dim), phase))
+            self._projections[key] = (proj, phase)
+        return self._projections[key]
 
     def forward(self, x: torch.Tensor) -> torch.Tensor:
         """
         x: [B, D_in]
         returns: [B, D_in * (include_input + 2 * num_freqs)]
+            laid out as [x, sin(f_0 x), cos(f_0 x), sin(f_1 x), cos(f_1 x), ...]
         """
-        out = [x] if self.include_input else []
-        for freq in self.freq_bands:
-            out.append(torch.sin(x * freq))
-            out.append(torch.cos(x * freq))
-        return torch.cat(out, dim=-1)
+        # A single matmul and a single sin for all the bands
+        # (instead of 2 * num_freqs small kernels and a concatenation)
+        D = x.shape[-1]
+        proj, phase = self.projection(D, x.device, x.dtype)
+        out = torch.addmm(phase, x.reshape(-1, D), proj)
+        out.sin_()
+        if self.include_input:
+            out[:, :D] = x.reshape(-1, D)
+        return out.reshape(*x.shape[:-1], -1)
+
+
+# Primes of "Instant Neural Graphics Primitives" (Müller et al. 2022), one per dimension
+HASH_PRIMES = (1, 2654435761, 805459861)
+
+
+class HashGridEncoding(nn.Module):
+    def __init__(
+        self,
+        input_dim: int = 2,
+        num_levels: int = 16,
+        features_per_level: int = 2,
+        log2_table_size: int = 19,
+        base_resolution: int = 16,
+        finest_resolution: int = 2048,
+    ):
+        """
+        Multiresolution hash-grid encoding (Instant-NGP), in pure PyTorch.
+
+        Args:
+            input_dim: 2 or 3, inputs are expected in [0, 1].
+            num_levels: number of grid resolutions (L).
+            features_per_level: number of features stored per grid vertex (F).
+            log2_table_size: log2 of the number of entries per level (T); coarse levels
+                with fewer vertices than T are indexed densely (no hash collision).
+            base_resolution, finest_resolution: resolutions of the coarsest and finest
+                levels (geometrically spaced in between).
+        """
+        super().__init__()
+        if input_dim not in (2, 3):
+            raise ValueError("HashGridEncoding only supports 2D and 3D inputs")
+        self.input_dim = input_dim
+        self.num_levels = num_levels
+        self.features_per_level = features_per_level
+        self.table_size = 2**log2_table_size
+        self.output_dim = num_levels * features_per_level
+
+        scale = (finest_resolution / base_resolution) ** (1 / max(num_levels - 1, 1))
+        resolutions = torch.tensor(
+            [int(base_resolution * scale**l + 1e-6) for l in range(num_levels)],
+            dtype=torch.float32,
+        )
+        self.register_buffer("resolutions", resolutions)
+        # The first levels, whose (res + 1)^D vertices fit in the table, don't need
+        # hashing: their vertices are indexed in row-major order
+        self.num_dense = int(((resolutions + 1) ** input_dim <= self.table_size).sum())
+        strides = (resolutions[None].long() + 1) ** torch.arange(input_dim)[:, None]
+        self.register_buffer("strides", strides[:, : self.num_dense])  # [D, L_dense]
+        # Offset of each level in the (flattened) table
+        self.register_buffer(
+            "level_offsets",
+            torch.arange(num_levels, dtype=torch.int64) * self.table_size,
+        )
+        # Offsets of the 2^D corners of a cell
+        self.corners = list(itertools.product((0, 1), repeat=input_dim))
+
+        # Feature-major table [F, L * T]: gathers and weights then broadcast over
+        # leading dimensions (fast), not over the (small) trailing one
+        self.embeddings = nn.Parameter(
+            torch.empty(features_per_level, num_levels * self.table_size).uniform_(
+                -1e-4, 1e-4
+            )
+        )
+
+    def vertex_indices(self, coords: list) -> torch.Tensor:
+        """
+        coords: D integer coordinates [B, L] of grid vertices (at each level)
+        returns: [B, L] indices in the (flattened) table
+        """
+        n = self.num_dense
+        dense = sum(c[..., :n] * s for c, s in zip(coords, self.strides))
+        hashed = coords[0][..., n:] * HASH_PRIMES[0]
+        for c, prime in zip(coords[1:], HASH_PRIMES[1:]):
+            hashed = hashed ^ (c[..., n:] * prime)
+        idx = torch.cat((dense, hashed & (self.table_size - 1)), dim=-1)
+        return idx + self.level_offsets
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        """
+        x: [B, D_in] in [0, 1]
+        returns: [B, num_levels * features_per_level]
+        """
+        # Position in the grid of each level, one [B, L] tensor per dimension
+        # (broadcasting over small trailing dimensions is slow)
+        cells, fracs = [], []
+        for d in range(self.input_dim):
+            pos = x[..., d, None] * self.resolutions
+            # (x = 1 falls in the last cell)
+            cell = torch.minimum(pos.floor(), self.resolutions - 1)
+            cells.append(cell.long())
+            fracs.append(pos - cell)
+
+        # Indices and bi/trilinear weights of the corners: [C, B, L]
+        indices, weights = [], []
+        for corner in self.corners:
+            weight = 1.0
+            for frac, offset in zip(fracs, corner):
+                weight = weight * (frac if offset else 1.0 - frac)
+            weights.append(weight)
+            indices.append(self.vertex_indices([c + o for c, o in zip(cells, corner)]))
+
+        # A single gather (and scatter in the backward pass) for all the corners
+        indices = torch.stack(indices)
+        features = self.embeddings.index_select(1, indices.flatten())
+        features = features.view(self.features_per_level, *indices.shape)
+        out = (torch.stack(weights) * features).sum(dim=1)  # [F, B, L]
+        return out.movedim(0, -1).flatten(-2)  # [B, L * F]
 
 
 class MlpField(nn.Module):
@@ -45,20 +186,30 @@ class MlpField(nn.Module):
         num_layers: int = 4,
         pe_freqs: int = 6,
         pe_include_input: bool = True,
+        encoding: str = "frequency",
+        hashgrid_kwargs: dict | None = None,
     ):
         """
         Args:
             input_dim: Number of input dimensions (D_in).
             output_dim: Number of output dimensions (D_out).
+            encoding: "frequency" (PositionalEncoding) or "hashgrid" (HashGridEncoding,
+                trainable, works well with a much smaller MLP).
+            hashgrid_kwargs: Additional arguments of HashGridEncoding.
         """
         super().__init__()
-        self.pe = PositionalEncoding(
-            num_freqs=pe_freqs,
-            include_input=pe_include_input,
-            log_sampling=True,
-        )
-
-        encoded_dim = input_dim * (int(pe_include_input) + 2 * pe_freqs)
+        if encoding == "frequency":
+            self.pe = PositionalEncoding(
+                num_freqs=pe_freqs,
+                include_input=pe_include_input,
+                log_sampling=True,
+            )
+            encoded_dim = input_dim * (int(pe_include_input) + 2 * pe_freqs)
+        elif encoding == "hashgrid":
+            self.pe = HashGridEncoding(input_dim=input_dim, **(hashgrid_kwargs or {}))
+            encoded_dim = self.pe.output_dim
+        else:
+            raise ValueError(f"Unknown encoding: {encoding}")
 
         layers = [nn.Linear(encoded_dim, hidden_dim), nn.ReLU(inplace=True)]
         for _ in range(num_layers - 1):
@@ -66,14 +217,195 @@ class MlpField(nn.Module):
         layers.append(nn.Linear(hidden_dim, output_dim))
         self.net = nn.Sequential(*layers)
 
-    def forward(self, x: torch.Tensor) -> torch.Tensor:
+    @property
+    def trainable_encoding(self) -> bool:
+        """
+        Whether the encoding has parameters (i.e., encoded inputs can't be cached)
+        """
+        return any(p.requires_grad for p in self.pe.parameters())
+
+    def encode(self, x: torch.Tensor) -> torch.Tensor:
         """
         x: [B, D_in] input tensor
+        Returns: [B, D_enc] encoded input (can be cached when `x` doesn't change,
+            unless `trainable_encoding`)
+        Always computed in float32, even under autocast: the phases of the highest
+        frequencies are too large for bfloat16.
+        """
+        with torch.autocast(x.device.type, enabled=False):
+            return self.pe(x.float())
+
+    def forward_encoded(self, x_enc: torch.Tensor) -> torch.Tensor:
+        """
+        x_enc: [B, D_enc] output of `encode`
         Returns: [B, D_out]
         """
-        x_enc = self.pe(x)
         return self.net(x_enc)
 
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        """
+        x: [B, D_in] input tensor
+        Returns: [B, D_out]
+        """
+        return self.forward_encoded(self.encode(x))
+
+
+class BatchedMlpField(nn.Module):
+    """
+    `num_fields` independent MlpFields (frequency encoding) trained at once, e.g., one per
+    image: the weights of each layer are stacked as [B, D_in, D_out] and applied with
+    batched matmuls. The encoding has no parameters, it is shared by all fields.
+    """
+
+    def __init__(
+        self,
+        num_fields: int,
+        input_dim: int = 2,
+        output_dim: int = 3,
+        hidden_dim: int = 256,
+        num_layers: int = 4,
+        pe_freqs: int = 6,
+        pe_include_input: bool = True,
+    ):
+        super().__init__()
+        self.num_fields = num_fields
+        # (to extract individual MlpFields, see `field`)
+        self.field_kwargs = dict(
+            input_dim=input_dim,
+            output_dim=output_dim,
+            hidden_dim=hidden_dim,
+            num_layers=num_layers,
+            pe_freqs=pe_freqs,
+            pe_include_input=pe_include_input,
+        )
+        self.pe = PositionalEncoding(
+            num_freqs=pe_freqs,
+            include_input=pe_include_input,
+            log_sampling=True,
+        )
+        encoded_dim = input_dim * (int(pe_include_input) + 2 * pe_freqs)
+
+        # Same layers (and initialization) as MlpField.net
+        dims = [encoded_dim] + [hidden_dim] * num_layers + [output_dim]
+        self.weights = nn.ParameterList()
+        self.biases = nn.ParameterList()
+        for d_in, d_out in zip(dims[:-1], dims[1:]):
+            bound = 1.0 / math.sqrt(d_in)
+            weight = torch.empty(num_fields, d_in, d_out).uniform_(-bound, bound)
+            bias = torch.empty(num_fields, 1, d_out).uniform_(-bound, bound)
+            self.weights.append(nn.Parameter(weight))
+            self.biases.append(nn.Parameter(bias))
+
+    def encode(self, x: torch.Tensor) -> torch.Tensor:
+        """
+        x: [N, D_in] (shared) or [B, N, D_in] input tensor
+        Returns: encoded input, see `MlpField.encode`
+        """
+        with torch.autocast(x.device.type, enabled=False):
+            return self.pe(x.float())
+
+    def forward_encoded(self, x_enc: torch.Tensor) -> torch.Tensor:
+        """
+        x_enc: [N, D_enc] (shared by all fields) or [B, N, D_enc] output of `encode`
+        Returns: [B, N, D_out]
+        """
+        h = x_enc.expand(self.num_fields, *x_enc.shape[-2:])
+        for i, (weight, bias) in enumerate(zip(self.weights, self.biases)):
+            h = torch.baddbmm(bias, h, weight)
+            if i < len(self.weights) - 1:
+                h = torch.relu_(h)
+        return h
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        """
+        x: [N, D_in] (shared) or [B, N, D_in] input tensor
+        Returns: [B, N, D_out]
+        """
+        return self.forward_encoded(self.encode(x))
+
+    @torch.no_grad()
+    def field(self, index: int) -> MlpField:
+        """
+        Copy of the `index`-th field as an MlpField (e.g., to save it as a checkpoint)
+        """
+        field = MlpField(**self.field_kwargs).to(self.weights[0].device)
+        linears = [m for m in field.net if isinstance(m, nn.Linear)]
+        for linear, weight, bias in zip(linears, self.weights, self.biases):
+            linear.weight.copy_(weight[index].T)
+            linear.bias.copy_(bias[index, 0])
+        return field
+
+
+PRECISIONS = ["float32", "bfloat16"]
+
+
+def autocast(device, precision: str = "float32"):
+    """
+    Autocast context of the forward pass: in "bfloat16", matmuls run in bfloat16 while
+    the parameters (and Adam's state) stay in float32. Cast outputs with `.float()`
+    before computing losses.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision: {precision}")
+    return torch.autocast(
+        torch.device(device).type,
+        dtype=torch.bfloat16,
+        enabled=precision == "bfloat16",
+    )
+
+
+# Where torch.compile stores its artifacts, so that they are reused across runs
+COMPILE_CACHE_DIR = "cache/torch_compile"
+
+
+def compile_field(
+    model: MlpField,
+    example_input: torch.Tensor,
+    backend: str = "torch.compile",
+    cache_dir: str = COMPILE_CACHE_DIR,
+) -> str:
+    """
+    Compile the encoder and the MLP of `model` in place (parameter names, and thus
+    checkpoints, are unchanged) with torch.compile, falling back to TorchScript (tracing).
+
+    Args:
+        model: the field to compile.
+        example_input: [B, D_in] input, used to trigger compilation (forward and backward)
+            right away, so that failures (e.g., no C++ compiler) are caught here.
+        backend: "torch.compile" (with TorchScript as a fallback) or "torchscript".
+        cache_dir: persistent cache of the compiled kernels/graphs (Inductor FX graph and
+            AOTAutograd caches), making subsequent runs start much faster.
+    Returns: the backend actually used: "torch.compile", "torchscript" or "eager".
+    """
+    if backend not in ("torch.compile", "torchscript"):
+        raise ValueError(f"Unknown backend: {backend}")
+
+    if backend == "torch.compile":
+        try:
+            # (read when compiling: must be set before the first compilation)
+            os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", os.path.abspath(cache_dir))
+            torch._inductor.config.fx_graph_cache = True
+            torch._functorch.config.enable_autograd_cache = True
+            model.pe.compile()
+            model.net.compile()
+            model(example_input).sum().backward()
+            model.zero_grad(set_to_none=True)
+            return "torch.compile"
+        except Exception as e:
+            print(f"torch.compile unavailable ({type(e).__name__}: {e})")
+            model.pe._compiled_call_impl = None
+            model.net._compiled_call_impl = None
+
+    try:
+        # Traced modules share the parameters of the original ones
+        example_enc = model.pe(example_input).detach()
+        model.pe = torch.jit.trace(model.pe, example_input, check_trace=False)
+        model.net = torch.jit.trace(model.net, example_enc, check_trace=False)
+        return "torchscript"
+    except Exception as e:
+        print(f"TorchScript unavailable ({type(e).__name__}: {e}), running eagerly")
+        return "eager"
+
 
 def normalized_pixel_grid(height, width, device="cpu"):
     y = torch.linspace(0, 1, steps=height, device=device)
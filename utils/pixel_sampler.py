@@ -0,0 +1,97 @@
+import torch
+import torch.nn.functional as F
+
+
+class PixelSampler:
+    """
+    Samples (continuous) pixel coordinates to train a neural field with minibatches,
+    either uniformly or proportionally to a (coarse) error map, and looks up the
+    corresponding target colors with bilinear interpolation.
+
+    Coordinates are (x, y) in [0, 1] as in `normalized_pixel_grid`: (0, 0) and (1, 1)
+    are the centers of the top-left and bottom-right pixels.
+    """
+
+    def __init__(
+        self,
+        image: torch.Tensor,
+        error_res: int = 64,
+        uniform_mix=0.2,
+        tiles=None,
+        tiles_per_batch: int = 16,
+    ):
+        """
+        image           : [H, W, C] target image
+        error_res       : resolution of the (square) error map, independent of the image's
+        uniform_mix     : fraction of uniform samples mixed in (keeps every region sampled)
+        tiles           : optional TiledImage, full-resolution target looked up instead of
+                          `image` (which can then be a low-resolution version)
+        tiles_per_batch : uniform batches only touch this many tiles of `tiles`
+        """
+        self.image = image.permute(2, 0, 1)[None]  # [1, C, H, W] for grid_sample
+        self.error_res = error_res
+        self.uniform_mix = uniform_mix
+        self.error = torch.ones(error_res * error_res, device=image.device)
+        self.tiles = tiles
+        self.tiles_per_batch = tiles_per_batch
+
+    def lookup(self, coords: torch.Tensor) -> torch.Tensor:
+        """
+        coords: [K, 2] (x, y) coordinates in [0, 1]
+        Returns: [K, C] bilinearly interpolated target colors
+        """
+        if self.tiles is not None:
+            return self.tiles.lookup(coords)
+        grid = (2.0 * coords - 1.0)[None, None]  # [1, 1, K, 2] in [-1, 1]
+        colors = F.grid_sample(self.image, grid, mode="bilinear", align_corners=True)
+        return colors[0, :, 0].T
+
+    def probabilities(self) -> torch.Tensor:
+        n_cells = self.error.numel()
+        p = self.error / self.error.sum()
+        return (1.0 - self.uniform_mix) * p + self.uniform_mix / n_cells
+
+    def sample(self, batch_size: int, importance: bool = False) -> tuple:
+        """
+        Returns [K, 2] coordinates and [K] weights: the weighted mean of the squared
+        errors is an unbiased estimate of the full-image MSE (weights are 1 if uniform).
+        """
+        device = self.error.device
+        if not importance:
+            if self.tiles is not None:
+                # (uniform too, but only reads a few tiles)
+                coords = self.tiles.sample_coords(
+                    batch_size, self.tiles_per_batch, device
+                )
+                return coords, torch.ones(batch_size, device=device)
+            coords = torch.rand(batch_size, 2, device=device)
+            return coords, torch.ones(batch_size, device=device)
+
+        p = self.probabilities()
+        cells = torch.multinomial(p, batch_size, replacement=True)
+        cell_y = torch.div(cells, self.error_res, rounding_mode="floor")
+        cell_x = cells % self.error_res
+        # Uniform within the cells
+        coords = torch.stack((cell_x, cell_y), dim=-1) + torch.rand(
+            batch_size, 2, device=device
+        )
+        weights = 1.0 / (p[cells] * p.numel())
+        return coords / self.error_res, weights
+
+    @torch.no_grad()
+    def update_errors(self, model):
+        """
+        Refresh the error map with the (squared) error of `model` at a random point
+        of each cell
+        """
+        n = self.error_res
+        device = self.error.device
+        cell_y, cell_x = torch.meshgrid(
+            torch.arange(n, device=device),
+            torch.arange(n, device=device),
+            indexing="ij",
+        )
+        cells = torch.stack((cell_x, cell_y), dim=-1).reshape(-1, 2)
+        coords = (cells + torch.rand(n * n, 2, device=device)) / n
+        error = (model(coords) - self.lookup(coords)).square().sum(dim=-1)
+        self.error = error + 1e-8
@@ -0,0 +1,145 @@
+import numpy as np
+
+# 6-connectivity
+FACE_OFFSETS = np.array(
+    [[1, 0, 0], [-1, 0, 0], [0, 1, 0], [0, -1, 0], [0, 0, 1], [0, 0, -1]]
+)
+
+
+class RunLengthVoxels:
+    """
+    Sparse voxel set stored as runs along the last (z) axis: the occupied voxels of
+    column (i, j) are the union of [starts[r], ends[r]) for r in [col_ptr[c], col_ptr[c + 1]),
+    with c = i * ny + j. Runs are sorted by column, then by start.
+
+    Solid voxelizations are mostly made of long runs, so this takes a few bytes per column
+    instead of one per voxel (dense occupancy) or 24 per voxel (int64 indices).
+    Voxels are numbered in the order of `np.argwhere(occupancy)`, i.e. the order of `indices`.
+    """
+
+    def __init__(
+        self, shape, col_ptr: np.ndarray, starts: np.ndarray, ends: np.ndarray
+    ):
+        """
+        shape   : (nx, ny, nz) shape of the grid
+        col_ptr : (nx * ny + 1,) index of the first run of each column
+        starts  : (R,) first voxel of each run
+        ends    : (R,) one past the last voxel of each run
+        """
+        self.shape = tuple(int(s) for s in shape)
+        run_dtype = np.uint16 if self.shape[2] < 1 << 16 else np.int32
+        self.col_ptr = np.asarray(col_ptr, dtype=np.int64)
+        self.starts = np.asarray(starts, dtype=run_dtype)
+        self.ends = np.asarray(ends, dtype=run_dtype)
+
+        # Index of the first voxel of each run, and sorted (column, start) keys for lookups
+        lengths = self.ends.astype(np.int64) - self.starts
+        self.run_offsets = np.concatenate([[0], np.cumsum(lengths)])
+        self.run_columns = np.repeat(
+            np.arange(len(self.col_ptr) - 1), np.diff(self.col_ptr)
+        )
+        self.run_keys = self.run_columns * (self.shape[2] + 1) + self.starts
+
+    def __len__(self) -> int:
+        return int(self.run_offsets[-1])
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [self.col_ptr, self.starts, self.ends]
+        arrays += [self.run_offsets, self.run_columns, self.run_keys]
+        return sum(a.nbytes for a in arrays)
+
+    @classmethod
+    def from_runs(
+        cls, shape, columns: np.ndarray, starts: np.ndarray, ends: np.ndarray
+    ):
+        """
+        Build from (unsorted, non-overlapping) runs of the given (linear) columns
+        """
+        keep = ends > starts
+        columns, starts, ends = columns[keep], starts[keep], ends[keep]
+        order = np.lexsort((starts, columns))
+        counts = np.bincount(columns, minlength=shape[0] * shape[1])
+        col_ptr = np.concatenate([[0], np.cumsum(counts)])
+        return cls(shape, col_ptr, starts[order], ends[order])
+
+    @classmethod
+    def from_occupancy(cls, occupancy: np.ndarray):
+        """
+        Build from a dense (nx, ny, nz) boolean occupancy
+        """
+        shape = occupancy.shape
+        columns = occupancy.reshape(-1, shape[2]).astype(np.int8)
+        # +1 where a run starts, -1 one past where it ends
+        padded = np.zeros((len(columns), shape[2] + 2), dtype=np.int8)
+        padded[:, 1:-1] = columns
+        change = np.diff(padded, axis=-1)
+        run_cols, starts = np.nonzero(change == 1)
+        _, ends = np.nonzero(change == -1)
+        return cls.from_runs(shape, run_cols, starts, ends)
+
+    @classmethod
+    def from_indices(cls, indices: np.ndarray, shape=None):
+        """
+        Build from (N, 3) integer voxel indices (e.g., `np.argwhere(occupancy)`)
+        """
+        if shape is None:
+            shape = indices.max(axis=0) + 1
+        keys = np.unique(np.ravel_multi_index(indices.T, shape))
+        # a run breaks where consecutive keys aren't neighbours in the same column
+        breaks = np.nonzero((np.diff(keys) != 1) | (keys[1:] % shape[2] == 0))[0] + 1
+        first = np.concatenate([[0], breaks])
+        last = np.concatenate([breaks, [len(keys)]]) - 1
+        columns, starts = np.divmod(keys[first], shape[2])
+        ends = keys[last] % shape[2] + 1
+        return cls.from_runs(shape, columns, starts, ends)
+
+    def to_occupancy(self) -> np.ndarray:
+        """
+        Dense (nx, ny, nz) boolean occupancy
+        """
+        nz = self.shape[2]
+        # +1 at the start of the runs and -1 at their end, then a cumulative sum
+        delta = np.zeros((self.shape[0] * self.shape[1], nz + 1), dtype=np.int8)
+        np.add.at(delta, (self.run_columns, self.starts), 1)
+        np.add.at(delta, (self.run_columns, self.ends), -1)
+        occupancy = np.cumsum(delta, axis=-1, dtype=np.int8) > 0
+        return occupancy[:, :nz].reshape(self.shape)
+
+    def to_indices(self, dtype=np.int64) -> np.ndarray:
+        """
+        (N, 3) integer voxel indices, in the same order as `np.argwhere(self.to_occupancy())`.
+        Use a smaller `dtype` (e.g., np.int32) for high resolutions.
+        """
+        N = len(self)
+        run = np.repeat(np.arange(len(self.starts)), np.diff(self.run_offsets))
+        indices = np.empty((N, 3), dtype=dtype)
+        indices[:, 0], indices[:, 1] = np.divmod(self.run_columns[run], self.shape[1])
+        indices[:, 2] = np.arange(N) - self.run_offsets[run] + self.starts[run]
+        return indices
+
+    def index_of(self, coords: np.ndarray) -> np.ndarray:
+        """
+        Index of the voxels at the (M, 3) integer `coords` (in the order of `to_indices`),
+        -1 if empty or outside of the grid.
+        """
+        coords = np.asarray(coords, dtype=np.int64)
+        if len(self.starts) == 0:
+            return np.full(len(coords), -1)
+        inside = np.all((coords >= 0) & (coords < self.shape), axis=-1)
+        columns = coords[:, 0] * self.shape[1] + coords[:, 1]
+        k = coords[:, 2]
+        # last run starting before (or at) each voxel
+        run = np.searchsorted(self.run_keys, columns * (self.shape[2] + 1) + k, "right")
+        run = np.maximum(run - 1, 0)
+        # (empty if the run is in another column, or if the voxel comes before it)
+        found = inside & (self.run_columns[run] == columns)
+        found &= (k >= self.starts[run]) & (k < self.ends[run])
+        return np.where(found, self.run_offsets[run] + k - self.starts[run], -1)
+
+    def neighbors(self, offsets: np.ndarray = FACE_OFFSETS) -> np.ndarray:
+        """
+        (N, K) index of the neighbour of each voxel at each of the (K, 3) `offsets` (-1 if empty)
+        """
+        indices = self.to_indices()
+        return np.stack([self.index_of(indices + o) for o in offsets], axis=-1)
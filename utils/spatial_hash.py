@@ -0,0 +1,85 @@
+import numpy as np
+
+# Large primes of "Optimized Spatial Hashing for Collision Detection of Deformable Objects"
+# (Teschner et al. 2003)
+HASH_PRIMES = np.array([73856093, 19349663, 83492791], dtype=np.int64)
+
+# A cell and half of the 26 cells around it (the other half is covered by symmetry)
+NEIGHBOR_CELLS = np.stack(
+    np.meshgrid([-1, 0, 1], [-1, 0, 1], [-1, 0, 1], indexing="ij"), axis=-1
+).reshape(-1, 3)[13:]
+
+
+class SpatialHash:
+    """
+    Vectorized uniform spatial hash to find all pairs of points closer than `radius`.
+
+    Points are sorted by (hashed) cell; each point then looks up its own cell
+    and half of the cells around it.
+    The sorting order of the previous query is reused as a starting point: for coherent
+    motion, keys are then almost sorted and re-sorting them is close to linear.
+    """
+
+    def __init__(self, radius: float):
+        """
+        radius : distance below which two points are reported (also the cell size)
+        """
+        self.radius = radius
+        self.order = None
+
+    def _hash(self, cells: np.ndarray) -> np.ndarray:
+        h = cells * HASH_PRIMES
+        return (h[..., 0] ^ h[..., 1] ^ h[..., 2]) & (self.table_size - 1)
+
+    def build(self, x: np.ndarray):
+        """
+        Sort the (N,3) points `x` by cell
+        """
+        N = x.shape[0]
+        # power of two, at least twice the number of points
+        self.table_size = 1 << max(int(2 * N - 1).bit_length(), 1)
+        self.cells = np.floor(x / self.radius).astype(np.int64)
+        keys = self._hash(self.cells)
+
+        # incremental re-sort, starting from the previous order
+        if self.order is None or len(self.order) != N:
+            self.order = np.arange(N)
+        self.order = self.order[np.argsort(keys[self.order], kind="stable")]
+
+        # start and size of each bucket in the sorted order
+        self.counts = np.bincount(keys, minlength=self.table_size)
+        self.starts = np.cumsum(self.counts) - self.counts
+
+    def query_pairs(self, x: np.ndarray) -> np.ndarray:
+        """
+        Returns (P,2) unique pairs (i < j) of points closer than `radius`
+        """
+        self.build(x)
+        N = x.shape[0]
+        ids = np.arange(N)
+
+        pairs = []
+        for offset in NEIGHBOR_CELLS:
+            keys = self._hash(self.cells + offset)
+            counts = self.counts[keys]
+            total = counts.sum()
+            if total == 0:
+                continue
+            # enumerate all the points of the neighbouring bucket of each point
+            i = np.repeat(ids, counts)
+            within = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            j = self.order[np.repeat(self.starts[keys], counts) + within]
+
+            # within a cell, only keep i < j (pairs across cells are found once)
+            keep = i < j if not offset.any() else i != j
+            i, j = i[keep], j[keep]
+            d = x[i] - x[j]
+            close = np.einsum("ij,ij->i", d, d) < self.radius**2
+            i, j = i[close], j[close]
+            pairs.append(np.minimum(i, j) * N + np.maximum(i, j))
+
+        if len(pairs) == 0:
+            return np.zeros((0, 2), dtype=np.int64)
+        # (hash collisions may report the same pair several times)
+        pairs = np.unique(np.concatenate(pairs))
+        return np.stack(np.divmod(pairs, N), axis=-1)
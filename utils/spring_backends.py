@@ -0,0 +1,169 @@
+import numpy as np
+
+# Alternative array backends for VoxelSpringSimulator.
+# They all read the precomputed terms of the simulator (Laplacian, constant forces,
+# per-column parameters, pinned indices) and keep its NumPy state arrays up to date.
+
+
+class TorchSpringBackend:
+    """
+    Steps the simulation with torch: sparse CSR product (multi-threaded on CPU)
+    and in-place updates. On CPU, the state tensors share memory with the simulator's arrays.
+    """
+
+    def __init__(self, sim, device="cpu"):
+        import torch
+
+        self.torch = torch
+        self.sim = sim
+        self.device = device
+
+        L = sim.L
+        self.L = torch.sparse_csr_tensor(
+            torch.from_numpy(L.indptr.astype(np.int64)),
+            torch.from_numpy(L.indices.astype(np.int64)),
+            torch.from_numpy(L.data),
+            size=L.shape,
+            check_invariants=False,
+        ).to(device)
+
+        self.load_parameters()
+        self.load_state()
+
+    def _tensor(self, a):
+        return self.torch.from_numpy(np.ascontiguousarray(a)).to(self.device)
+
+    def load_parameters(self):
+        """(Re)load the parameters precomputed by the simulator"""
+        sim = self.sim
+        self.k = self._tensor(sim._k)
+        self.damping = self._tensor(sim._damping)
+        self.Minv = self._tensor(sim._Minv)
+        self.F_const = self._tensor(sim._F_const)
+        self.fixed_idx = self._tensor(sim._fixed_idx)
+        self.x0_fixed = self._tensor(sim._x0_fixed)
+
+    def load_state(self):
+        """(Re)load x and v from the simulator (no copy on CPU)"""
+        self.x = self._tensor(self.sim._x)
+        self.v = self._tensor(self.sim._v)
+
+    def step(self, dt):
+        x, v = self.x, self.v
+
+        # spring force + constant forces (i.e., c + gravity) + damping
+        F_total = self.L @ x
+        F_total.mul_(-self.k).add_(self.F_const).addcmul_(v, self.damping, value=-1.0)
+
+        # semi‐implicit Euler
+        v.addcmul_(F_total, self.Minv, value=dt)
+        v.view(-1).index_fill_(0, self.fixed_idx, 0.0)
+
+        x.add_(v, alpha=dt)
+        x.view(-1).index_copy_(0, self.fixed_idx, self.x0_fixed)
+
+        # Write back to the simulator (only when the tensors don't share memory)
+        if self.device != "cpu":
+            self.sim._x[:] = x.cpu().numpy()
+            self.sim._v[:] = v.cpu().numpy()
+
+
+class DrJitSpringBackend:
+    """
+    Steps the simulation with Dr.Jit LLVM arrays: the spring forces (gathers + scatter-add
+    over the edges), velocity and position updates are traced and fused into a few kernels.
+    """
+
+    def __init__(self, sim):
+        import drjit as dr
+
+        self.dr = dr
+        self.sim = sim
+        if sim.dtype == np.float32:
+            from drjit.llvm import Float32 as Float
+        else:
+            from drjit.llvm import Float64 as Float
+        from drjit.llvm import UInt32, Bool
+
+        self.Float, self.UInt32, self.Bool = Float, UInt32, Bool
+
+        # Laplacian as a (N, 6) neighbour table, expanded over the state columns:
+        # the forces are then plain (masked) gathers, without atomics
+        C = sim._x.shape[1]
+        src = np.concatenate([sim.edges[:, 0], sim.edges[:, 1]])
+        dst = np.concatenate([sim.edges[:, 1], sim.edges[:, 0]])
+        order = np.argsort(src, kind="stable")
+        src, dst = src[order], dst[order]
+        deg = np.bincount(src, minlength=sim.N)
+        slot = np.arange(len(src)) - (np.cumsum(deg) - deg)[src]
+        table = np.full((6, sim.N), -1, dtype=np.int64)
+        table[slot, src] = dst
+
+        cols = np.arange(C)
+        self.nbr_idx, self.nbr_mask = [], []
+        for nbr in table:
+            idx = (np.maximum(nbr, 0)[:, None] * C + cols).ravel()
+            self.nbr_idx.append(UInt32(idx.astype(np.uint32)))
+            self.nbr_mask.append(Bool(np.repeat(nbr >= 0, C)))
+        self.deg = Float(np.repeat(deg, C).astype(sim.dtype))
+        self.size = sim.N * C
+
+        self.load_parameters()
+        self.load_state()
+
+    def _flat(self, a):
+        """(N, C) array -> flat Dr.Jit array, broadcasting per-column parameters"""
+        a = np.broadcast_to(a, self.sim._x.shape)
+        return self.Float(np.ascontiguousarray(a, dtype=self.sim.dtype).ravel())
+
+    def load_parameters(self):
+        """(Re)load the parameters precomputed by the simulator"""
+        sim = self.sim
+        self.k = self._flat(sim._k)
+        self.damping = self._flat(sim._damping)
+        self.Minv = self._flat(sim._Minv)
+        self.F_const = self._flat(sim._F_const)
+        fixed = np.zeros(self.size, dtype=bool)
+        fixed[sim._fixed_idx] = True
+        self.fixed = self.Bool(fixed)
+        self.x0 = self._flat(sim._x0)
+
+    def load_state(self):
+        """(Re)load x and v from the simulator"""
+        self.x = self._flat(self.sim._x)
+        self.v = self._flat(self.sim._v)
+
+    def step(self, dt):
+        dr = self.dr
+        # opaque, so that changing dt doesn't trigger a recompilation
+        dt = dr.opaque(self.Float, dt)
+        x, v = self.x, self.v
+
+        # L @ x = deg * x - sum_j x_j
+        Lx = self.deg * x
+        for idx, mask in zip(self.nbr_idx, self.nbr_mask):
+            Lx -= dr.gather(self.Float, x, idx, active=mask)
+
+        # spring force + constant forces (i.e., c + gravity) + damping
+        F_total = -self.k * Lx + self.F_const - self.damping * v
+
+        # semi‐implicit Euler
+        v = dr.select(self.fixed, 0.0, v + dt * F_total * self.Minv)
+        x = dr.select(self.fixed, self.x0, x + dt * v)
+        dr.eval(x, v)
+        self.x, self.v = x, v
+
+        # Write back to the simulator
+        np.copyto(self.sim._x, x.numpy().reshape(self.sim._x.shape))
+        np.copyto(self.sim._v, v.numpy().reshape(self.sim._v.shape))
+
+
+def make_backend(sim, backend: str):
+    """Returns the backend stepping `sim`, or None for the default NumPy path"""
+    if backend == "numpy":
+        return None
+    if backend == "torch":
+        return TorchSpringBackend(sim)
+    if backend == "drjit":
+        return DrJitSpringBackend(sim)
+    raise ValueError(f"Unknown backend: {backend}")
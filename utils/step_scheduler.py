@@ -0,0 +1,86 @@
+import time
+
+
+class FixedStepScheduler:
+    """
+    Advances a simulation with fixed-size substeps, decoupled from the frame rate.
+
+    Every frame, `frame_dt` seconds of simulated time are queued (or, in real-time mode,
+    the wall-clock time elapsed since the previous frame scaled by `time_scale`).
+    The queued time is then consumed with substeps of size `frame_dt / substeps`,
+    as long as the per-frame compute budget allows it.
+    """
+
+    def __init__(
+        self,
+        frame_dt: float = 0.02,
+        substeps: int = 1,
+        budget_ms: float = 12.0,
+        realtime: bool = False,
+        time_scale: float = 1.0,
+    ):
+        """
+        frame_dt   : simulated time advanced per frame (fixed mode)
+        substeps   : number of substeps the frame is split into
+        budget_ms  : maximum wall-clock time spent simulating per frame
+        realtime   : if True, advance simulated time with the wall clock instead
+        time_scale : simulated seconds per wall-clock second (real-time mode)
+        """
+        self.frame_dt = frame_dt
+        self.substeps = substeps
+        self.budget_ms = budget_ms
+        self.realtime = realtime
+        self.time_scale = time_scale
+        self.reset()
+
+    @property
+    def h(self) -> float:
+        """Size of a single (fixed) substep."""
+        return self.frame_dt / max(int(self.substeps), 1)
+
+    def reset(self):
+        self.accumulator = 0.0
+        self.sim_time = 0.0
+        self.steps_last_frame = 0
+        self.compute_ms = 0.0
+        self.realtime_factor = 0.0
+        self._last_wall = None
+
+    def advance(self, step_fn) -> int:
+        """
+        Run as many substeps `step_fn(h)` as the queued time and budget allow.
+        Returns the number of substeps taken this frame.
+        """
+        now = time.perf_counter()
+        wall_dt = 0.0 if self._last_wall is None else now - self._last_wall
+        self._last_wall = now
+
+        # 1. Queue simulated time for this frame
+        if self.realtime:
+            self.accumulator += wall_dt * self.time_scale
+        else:
+            self.accumulator += self.frame_dt
+
+        # 2. Consume it with fixed substeps, within the compute budget
+        h = self.h
+        n_steps = 0
+        # (small tolerance so that `substeps` steps always fit in one frame)
+        while self.accumulator >= h * (1.0 - 1e-6):
+            step_fn(h)
+            self.accumulator -= h
+            n_steps += 1
+            if (time.perf_counter() - now) * 1000.0 > self.budget_ms:
+                break
+
+        # 3. Drop any backlog beyond one frame (we can't keep up, avoid spiraling)
+        self.accumulator = min(self.accumulator, self.frame_dt)
+
+        # 4. Bookkeeping (smoothed to keep the GUI readable)
+        self.sim_time += n_steps * h
+        self.steps_last_frame = n_steps
+        self.compute_ms = (time.perf_counter() - now) * 1000.0
+        if wall_dt > 0.0:
+            rtf = n_steps * h / wall_dt
+            self.realtime_factor = 0.9 * self.realtime_factor + 0.1 * rtf
+
+        return n_steps
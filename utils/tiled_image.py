@@ -0,0 +1,230 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import torch
+from PIL import Image
+
+# Bump when the storage format changes, to invalidate old caches
+TILE_CACHE_VERSION = 1
+
+
+def tile_pixel_ids(size: int, tile_size: int, num_tiles: int) -> np.ndarray:
+    """
+    [n, T + 1] pixel rows (or columns) stored in each row (or column) of tiles
+    """
+    ids = tile_size * np.arange(num_tiles)[:, None] + np.arange(tile_size + 1)
+    return np.minimum(ids, size - 1)
+
+
+def downsample(pixels: np.ndarray, rows_per_strip: int = 1024) -> np.ndarray:
+    """
+    2x box-filtered downsampling of a [S, S, 3] uint8 image (by strips of rows: the
+    uint16 intermediate stays small)
+    """
+    s = len(pixels) // 2
+    out = np.empty((s, s, 3), dtype=np.uint8)
+    for start in range(0, s, rows_per_strip):
+        strip = pixels[2 * start : 2 * min(start + rows_per_strip, s), : 2 * s]
+        acc = strip[0::2, 0::2].astype(np.uint16)
+        acc += strip[1::2, 0::2]
+        acc += strip[0::2, 1::2]
+        acc += strip[1::2, 1::2]
+        out[start : start + len(acc)] = (acc + 2) // 4
+    return out
+
+
+class TiledImage:
+    """
+    Square (center-cropped, as in 05_neural_field.py) target image stored in a
+    memory-mapped uint8 tile cache, for targets too large to be held as a dense float
+    tensor (e.g., multi-gigapixel images trained with minibatches).
+
+    The image is decoded once, when the cache is built (see `open`). Then:
+    - level 0 (full resolution) is stored as [n, n, T + 1, T + 1, 3] tiles of T pixels
+      overlapping by one pixel, so that bilinear lookups never cross tiles: lookups
+      and minibatches (see `sample_coords`) only read the pages of the tiles they touch,
+    - a pyramid of 2x (box-filtered) downsampled levels provides low-resolution
+      versions (e.g., thumbnails, display targets) without touching level 0.
+
+    Coordinates are (x, y) in [0, 1] as in `normalized_pixel_grid`: (0, 0) and (1, 1)
+    are the centers of the top-left and bottom-right pixels.
+    """
+
+    def __init__(self, directory: str):
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        self.size = meta["size"]
+        self.tile_size = meta["tile_size"]
+        self.num_tiles = meta["num_tiles"]
+        T, n = self.tile_size, self.num_tiles
+        self.tiles = np.memmap(
+            os.path.join(directory, "tiles.u8"),
+            dtype=np.uint8,
+            mode="r",
+            shape=(n, n, T + 1, T + 1, 3),
+        )
+        self.levels = [
+            np.memmap(
+                os.path.join(directory, f"level_{i + 1}.u8"),
+                dtype=np.uint8,
+                mode="r",
+                shape=(s, s, 3),
+            )
+            for i, s in enumerate(meta["level_sizes"])
+        ]
+        # Continuous extent (in pixels) covered by each row/column of tiles
+        last = self.size - 1
+        self.tile_extents = np.minimum(T, last - T * np.arange(n)).astype(np.float32)
+
+    @classmethod
+    def open(
+        cls,
+        path: str,
+        cache_dir: str = "cache/tiles",
+        tile_size: int = 256,
+        thumbnail_size: int = 512,
+    ):
+        """
+        Open the tile cache of the image at `path`, building it first if needed.
+        Entries are keyed by the path, size and modification time of the image
+        (hashing the content of multi-gigabyte files would take longer than loading).
+        """
+        stat = os.stat(path)
+        key = [os.path.abspath(path), stat.st_size, stat.st_mtime_ns]
+        key = "_".join(map(str, key + [tile_size, thumbnail_size, TILE_CACHE_VERSION]))
+        directory = os.path.join(cache_dir, hashlib.sha256(key.encode()).hexdigest())
+        if not os.path.exists(os.path.join(directory, "meta.json")):
+            cls.build(path, directory, tile_size, thumbnail_size)
+        return cls(directory)
+
+    @staticmethod
+    def build(path: str, directory: str, tile_size: int, thumbnail_size: int):
+        """
+        Decode the image at `path` (once, as uint8) into a tile cache in `directory`
+        """
+        # (written next to `directory`, then renamed: readers never see partial caches)
+        tmp_directory = f"{directory}.{os.getpid()}.tmp"
+        os.makedirs(tmp_directory, exist_ok=True)
+
+        max_pixels = Image.MAX_IMAGE_PIXELS
+        Image.MAX_IMAGE_PIXELS = None  # (gigapixel images are expected)
+        try:
+            with Image.open(path) as image:
+                image = image.convert("RGB")
+                pixels = np.asarray(image)
+        finally:
+            Image.MAX_IMAGE_PIXELS = max_pixels
+        # Center crop
+        height, width = pixels.shape[:2]
+        S = min(height, width)
+        top, left = (height - S) // 2, (width - S) // 2
+        pixels = pixels[top : top + S, left : left + S]
+
+        # Level 0: tiles with a one-pixel overlap (edges are replicated)
+        T = tile_size
+        n = max(1, -(-(S - 1) // T))
+        tiles = np.memmap(
+            os.path.join(tmp_directory, "tiles.u8"),
+            dtype=np.uint8,
+            mode="w+",
+            shape=(n, n, T + 1, T + 1, 3),
+        )
+        ids = tile_pixel_ids(S, T, n)
+        for ty in range(n):
+            rows = pixels[ids[ty]]  # [T + 1, S, 3]
+            tiles[ty] = rows[:, ids].transpose(1, 0, 2, 3)
+        tiles.flush()
+        del tiles
+
+        # Pyramid: halve until the thumbnail size
+        level_sizes = []
+        level = pixels
+        while len(level) > thumbnail_size:
+            level = downsample(level)
+            level_sizes.append(len(level))
+            level.tofile(os.path.join(tmp_directory, f"level_{len(level_sizes)}.u8"))
+
+        with open(os.path.join(tmp_directory, "meta.json"), "w") as f:
+            meta = dict(size=S, tile_size=T, num_tiles=n, level_sizes=level_sizes)
+            json.dump(meta, f)
+        try:
+            os.replace(tmp_directory, directory)
+        except OSError:
+            # (built concurrently by another process)
+            shutil.rmtree(tmp_directory, ignore_errors=True)
+
+    def level(self, res: int) -> np.ndarray:
+        """
+        Smallest stored level of at least `res` pixels (the full image if none)
+        """
+        for level in reversed(self.levels):
+            if len(level) >= res:
+                return level
+        # Reassemble level 0 from the tiles
+        n = self.num_tiles
+        ids = tile_pixel_ids(self.size, self.tile_size, n)
+        full = np.empty((self.size, self.size, 3), dtype=np.uint8)
+        for ty in range(n):
+            for tx in range(n):
+                full[np.ix_(ids[ty], ids[tx])] = self.tiles[ty, tx]
+        return full
+
+    def thumbnail(self) -> Image.Image:
+        return Image.fromarray(np.asarray(self.level(0)))
+
+    def resized(self, res: int) -> torch.Tensor:
+        """
+        [res, res, 3] float tensor in [0, 1] (from the closest pyramid level)
+        """
+        image = Image.fromarray(np.asarray(self.level(res)))
+        if image.width != res:
+            image = image.resize((res, res), Image.BILINEAR)
+        return torch.from_numpy(np.asarray(image, dtype=np.float32) / 255.0)
+
+    def sample_coords(
+        self, batch_size: int, tiles_per_batch: int = 16, device="cpu"
+    ) -> torch.Tensor:
+        """
+        [K, 2] uniformly distributed coordinates, drawn from `tiles_per_batch` random
+        tiles only (tiles are picked proportionally to their area, so that the
+        coordinates are uniform over the image)
+        """
+        T, n = self.tile_size, self.num_tiles
+        extents = torch.from_numpy(self.tile_extents)
+        area = (extents[:, None] * extents[None, :]).flatten()
+        tiles = torch.multinomial(area, tiles_per_batch, replacement=True)
+        tiles = tiles[torch.randint(tiles_per_batch, (batch_size,))]
+        tile_yx = torch.stack((tiles // n, tiles % n), dim=-1)  # [K, 2]
+        offsets = torch.rand(batch_size, 2) * extents[tile_yx]
+        pixels = (T * tile_yx + offsets).flip(-1)  # (x, y)
+        return (pixels / (self.size - 1)).to(device)
+
+    def lookup(self, coords: torch.Tensor) -> torch.Tensor:
+        """
+        coords: [K, 2] (x, y) coordinates in [0, 1]
+        Returns: [K, 3] bilinearly interpolated colors in [0, 1] (full resolution)
+        """
+        T, n = self.tile_size, self.num_tiles
+        pixels = coords.detach().cpu().numpy().astype(np.float64) * (self.size - 1)
+        tile = np.clip(np.floor(pixels / T), 0, n - 1).astype(np.int64)
+        local = pixels - T * tile
+        corner = np.clip(np.floor(local), 0, T - 1).astype(np.int64)
+        frac = torch.from_numpy((local - corner).astype(np.float32))
+
+        # Flat index of the top-left corner, then of the 2x2 corners x 3 channels
+        # (a single gather, which only reads the touched pages of the memory map)
+        row = 3 * (T + 1)
+        tile_id = tile[:, 1] * n + tile[:, 0]
+        first = tile_id * (T + 1) * row + corner[:, 1] * row + 3 * corner[:, 0]
+        offsets = np.array([0, 3, row, row + 3])[:, None] + np.arange(3)
+        flat = self.tiles.reshape(-1)
+        corners = torch.from_numpy(flat[first[:, None, None] + offsets]).float()
+        c00, c01, c10, c11 = corners.unbind(dim=1)
+        fx, fy = frac[:, :1], frac[:, 1:]
+        top = c00 + fx * (c01 - c00)
+        bottom = c10 + fx * (c11 - c10)
+        colors = (top + fy * (bottom - top)) / 255.0
+        return colors.to(coords.device)
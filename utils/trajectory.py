@@ -0,0 +1,162 @@
+import json
+import os
+
+import numpy as np
+
+# A trajectory is a directory containing:
+#   meta.json         : frame shape, dtype, chunk size, number of frames, user attributes
+#   edges.npy         : static (E, 2) edges
+#   chunk_XXXXX.npy   : (chunk_size, *frame_shape) frames, memory-mapped
+#   key_XXXXX.npy     : (delta compression only) float32 reference frame of each chunk
+# All arrays are little-endian .npy files, so runs can be copied between machines.
+
+TRAJECTORY_VERSION = 1
+
+
+class TrajectoryWriter:
+    """
+    Streams frames into chunked, memory-mapped files, optionally in float16
+    and/or delta-compressed (i.e., relative to the first frame of each chunk).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        edges: np.ndarray,
+        chunk_size: int = 256,
+        float16: bool = False,
+        delta: bool = False,
+        attrs: dict | None = None,
+    ):
+        """
+        path       : directory of the trajectory (created if needed)
+        edges      : (E, 2) static edges stored alongside the frames
+        chunk_size : number of frames per chunk file
+        float16    : store frames as float16 (half the size of float32)
+        delta      : store frames relative to the first frame of their chunk
+                     (more precise when combined with float16)
+        attrs      : additional (JSON-serializable) attributes stored in meta.json
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "edges.npy"), np.asarray(edges, dtype="<i4"))
+
+        self.chunk_size = chunk_size
+        self.dtype = np.dtype("<f2" if float16 else "<f4")
+        self.delta = delta
+        self.attrs = attrs or {}
+        self.frame_shape = None
+        self.num_frames = 0
+        self.chunk = None
+        self.key = None
+
+    def _chunk_path(self, prefix: str, index: int) -> str:
+        return os.path.join(self.path, f"{prefix}_{index:05d}.npy")
+
+    def _write_meta(self):
+        meta = dict(
+            version=TRAJECTORY_VERSION,
+            frame_shape=list(self.frame_shape or []),
+            dtype=self.dtype.str,
+            delta=self.delta,
+            chunk_size=self.chunk_size,
+            num_frames=self.num_frames,
+            attrs=self.attrs,
+        )
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=2)
+
+    def append(self, frame: np.ndarray):
+        """
+        Append a frame (e.g., `sim.x`), all frames must share the same shape
+        """
+        if self.frame_shape is None:
+            self.frame_shape = tuple(frame.shape)
+        elif tuple(frame.shape) != self.frame_shape:
+            raise ValueError("All frames of a trajectory must have the same shape")
+
+        chunk_id, i = divmod(self.num_frames, self.chunk_size)
+        if i == 0:
+            # Start a new chunk (and flush the previous one)
+            self.chunk = np.lib.format.open_memmap(
+                self._chunk_path("chunk", chunk_id),
+                mode="w+",
+                dtype=self.dtype,
+                shape=(self.chunk_size, *self.frame_shape),
+            )
+            if self.delta:
+                self.key = np.asarray(frame, dtype="<f4")
+                np.save(self._chunk_path("key", chunk_id), self.key)
+
+        if self.delta:
+            self.chunk[i] = frame - self.key
+        else:
+            self.chunk[i] = frame
+        self.num_frames += 1
+
+        if i == self.chunk_size - 1:
+            self.chunk.flush()
+            self._write_meta()
+
+    def close(self):
+        """
+        Flush the frames and truncate the last chunk to the frames actually written
+        """
+        if self.chunk is not None:
+            n = self.num_frames % self.chunk_size
+            if n > 0:
+                last = np.array(self.chunk[:n])
+                del self.chunk
+                np.save(
+                    self._chunk_path("chunk", self.num_frames // self.chunk_size), last
+                )
+            self.chunk = None
+        self._write_meta()
+
+
+class TrajectoryReader:
+    """
+    Random access to the frames of a trajectory, read through memory maps
+    (only the chunks that are accessed are actually read from disk).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        if meta["version"] > TRAJECTORY_VERSION:
+            raise ValueError(f"Unsupported trajectory version: {meta['version']}")
+        self.frame_shape = tuple(meta["frame_shape"])
+        self.chunk_size = meta["chunk_size"]
+        self.num_frames = meta["num_frames"]
+        self.delta = meta["delta"]
+        self.attrs = meta["attrs"]
+        self.edges = np.load(os.path.join(path, "edges.npy")).astype(int)
+        self._chunks = {}
+        self._keys = {}
+
+    def __len__(self) -> int:
+        return self.num_frames
+
+    def _chunk(self, chunk_id: int) -> np.ndarray:
+        if chunk_id not in self._chunks:
+            self._chunks[chunk_id] = np.load(
+                os.path.join(self.path, f"chunk_{chunk_id:05d}.npy"), mmap_mode="r"
+            )
+            if self.delta:
+                self._keys[chunk_id] = np.load(
+                    os.path.join(self.path, f"key_{chunk_id:05d}.npy")
+                )
+        return self._chunks[chunk_id]
+
+    def __getitem__(self, index: int) -> np.ndarray:
+        """
+        Returns frame `index` as a float32 array
+        """
+        if not 0 <= index < self.num_frames:
+            raise IndexError(f"Frame {index} out of range ({self.num_frames} frames)")
+        chunk_id, i = divmod(index, self.chunk_size)
+        frame = self._chunk(chunk_id)[i].astype(np.float32)
+        if self.delta:
+            frame += self._keys[chunk_id]
+        return frame
@@ -0,0 +1,126 @@
+import hashlib
+import os
+import zipfile
+
+import numpy as np
+import trimesh
+
+from utils.voxelize import mesh_to_voxel_grid_indices
+
+# Bump when the voxelization (or the storage format) changes, to invalidate old entries
+VOXEL_CACHE_VERSION = 1
+
+
+def file_hash(path: str, chunk_size: int = 1 << 20) -> str:
+    """
+    SHA-256 of the content of a file (read by chunks)
+    """
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class VoxelCache:
+    """
+    Content-addressed on-disk cache of voxelizations.
+
+    Entries are keyed by the hash of the mesh file, the resolution and the method,
+    so renamed/moved files still hit and edited files miss. Each entry is a compressed
+    .npz (bit-packed occupancy, indices, transform). The least recently used entries
+    (by modification time, refreshed on each hit) are evicted above `max_bytes`.
+    """
+
+    def __init__(self, cache_dir: str = "cache/voxels", max_bytes: int = 256 << 20):
+        """
+        cache_dir : directory of the cache (created if needed)
+        max_bytes : maximum total size of the cache entries
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def entry_path(self, input_path: str, resolution: int, method: str) -> str:
+        key = f"{file_hash(input_path)}_{resolution}_{method}_v{VOXEL_CACHE_VERSION}"
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def load(self, path: str) -> tuple | None:
+        """
+        Returns (occupancy, indices, transform) stored at `path`, or None if missing/corrupted
+        """
+        try:
+            with np.load(path) as data:
+                shape = tuple(data["shape"])
+                occupancy = np.unpackbits(data["occupancy"], count=np.prod(shape))
+                occupancy = occupancy.reshape(shape).astype(bool)
+                indices = data["indices"].astype(np.int64)
+                transform = data["transform"]
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            return None
+        # Mark as recently used (unless evicted by another process in the meantime)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return occupancy, indices, transform
+
+    def save(self, path: str, occupancy, indices, transform):
+        # Smallest index type that fits (voxel indices are bounded by the resolution)
+        index_dtype = np.uint16 if max(occupancy.shape) <= 1 << 16 else np.int64
+        # Write to a temporary file first: concurrent readers never see partial entries
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            shape=np.array(occupancy.shape),
+            occupancy=np.packbits(occupancy, axis=None),
+            indices=indices.astype(index_dtype),
+            transform=transform,
+        )
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in `max_bytes`
+        """
+        # (other processes may evict the same entries concurrently: skip missing ones)
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".npz") and not name.endswith(".tmp.npz"):
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def voxelize(
+        self,
+        input_path: str,
+        mesh: trimesh.Trimesh,
+        resolution: int = 100,
+        method: str = "subdivide",
+    ) -> tuple:
+        """
+        Same as `mesh_to_voxel_grid_indices(mesh, resolution, method, return_transform=True)`,
+        skipping the voxelization if the mesh file at `input_path` was already voxelized.
+        """
+        path = self.entry_path(input_path, resolution, method)
+        entry = self.load(path) if os.path.exists(path) else None
+        if entry is not None:
+            return entry
+
+        occupancy, indices, transform = mesh_to_voxel_grid_indices(
+            mesh, resolution, method=method, return_transform=True
+        )
+        self.save(path, occupancy, indices, transform)
+        return occupancy, indices, transform
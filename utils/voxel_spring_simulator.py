@@ -1,6 +1,18 @@
+import time
+
 import numpy as np
 import scipy.sparse as sp
 
+try:
+    # In-place (accumulating) CSR products: Y += A @ X, without temporaries
+    # (private to scipy: checked against L @ x before use, see `_check_csr_matvecs`)
+    from scipy.sparse._sparsetools import csr_matvecs
+except ImportError:
+    csr_matvecs = None
+
+from utils.spring_backends import make_backend
+from utils.spatial_hash import SpatialHash
+
 # Vibe-coded with ChatGPT!
 
 
@@ -15,94 +27,375 @@ class VoxelSpringSimulator:
         damping=0.01,
         gravity=np.array([0.0, 0.0, -9.81]),
         fixed=None,
+        batch_size=None,
+        dtype=np.float64,
+        backend="numpy",
     ):
         """
         coords          : (N,3) array of integer grid coordinates for adjacency
         rest_positions : optional (N,3) rest‐state positions; defaults to coords
         init_positions : optional (N,3) starting positions; defaults to rest_positions
-        stiffness      : spring constant k
+        stiffness      : spring constant k (or length‐B array when batched)
         mass           : scalar or length‐N array of per‐voxel masses
-        damping        : viscous damping coefficient
-        gravity        : 3‐vector
-        fixed          : list of vertex‐indices (or boolean mask) to pin
+        damping        : viscous damping coefficient (or length‐B array when batched)
+        gravity        : 3‐vector (or (B,3) array when batched)
+        fixed          : list of vertex‐indices (or boolean mask) to pin;
+                         when batched, also accepts a (B,N) boolean mask
+        batch_size     : optional B; simulates B parameter sets at once on
+                         (B,N,3) states sharing the same Laplacian
+        dtype          : float dtype of the state (np.float32 halves memory traffic)
+        backend        : 'numpy', 'torch' (sparse CSR tensors) or 'drjit' (LLVM arrays)
         """
         # store adjacency coords (integers)
         self.coords = np.array(coords, dtype=int)
         self.N = self.coords.shape[0]
+        self.B = batch_size
+        self.dtype = np.dtype(dtype)
+        nb = 1 if batch_size is None else int(batch_size)
 
         # rest state x0
         if rest_positions is None:
-            self.x0 = self.coords.astype(float).copy()
+            x0 = self.coords.astype(float)
         else:
-            rp = np.array(rest_positions, dtype=float)
-            if rp.shape != self.coords.shape:
+            x0 = np.array(rest_positions, dtype=float)
+            if x0.shape != self.coords.shape:
                 raise ValueError("rest_positions must match coords shape")
-            self.x0 = rp.copy()
 
         # initial state x
         if init_positions is None:
-            self.x = self.x0.copy()
+            x = x0
         else:
-            ip = np.array(init_positions, dtype=float)
-            if ip.shape != self.coords.shape:
+            x = np.array(init_positions, dtype=float)
+            if x.shape != self.coords.shape:
                 raise ValueError("init_positions must match coords shape")
-            self.x = ip.copy()
 
+        # States are stored as (N, B*3) arrays so that a single sparse product
+        # updates every batch member. `x`, `v` and `x0` are views on them,
+        # of shape (N,3) or (B,N,3) when batched: update them in place!
+        self._x0 = np.ascontiguousarray(np.tile(x0, (1, nb)), dtype=self.dtype)
+        self._x = np.ascontiguousarray(np.tile(x, (1, nb)), dtype=self.dtype)
         # zero initial velocity
-        self.v = np.zeros_like(self.x)
+        self._v = np.zeros_like(self._x)
+        self.x0 = self._batch_view(self._x0)
+        self.x = self._batch_view(self._x)
+        self.v = self._batch_view(self._v)
 
-        # physical parameters
-        self.k = float(stiffness)
-        self.damping = float(damping)
+        # masses
         m_arr = mass * np.ones(self.N) if np.isscalar(mass) else np.array(mass, float)
         self.Minv = 1.0 / m_arr
-        self.gravity = np.array(gravity, float)
+        self._M = m_arr[:, None].astype(self.dtype)
+        self._Minv = self.Minv[:, None].astype(self.dtype)
 
         # build adjacency by Manhattan‐1 neighbors (positive directions)
-        coord_to_idx = {tuple(c): i for i, c in enumerate(self.coords)}
-        offsets = [(1, 0, 0), (0, 1, 0), (0, 0, 1)]
+        self._build_grid()
+        self.edges = self._build_edges()
+
+        # spring Laplacian L = D - A
+        self._init_sparse_laplacian()
+
+        # per-column (i.e., per batch member and axis) parameters
+        # and precomputed terms, all updated in place by the setters below
+        self._backend = None
+        self._k = np.zeros(3 * nb, dtype=self.dtype)
+        self._damping = np.zeros(3 * nb, dtype=self.dtype)
+        self._gravity = np.zeros(3 * nb, dtype=self.dtype)
+        self.c = np.zeros_like(self._x0)
+        self._F_const = np.zeros_like(self._x0)
+
+        # physical parameters
+        self.set_gravity(gravity)
+        self.set_stiffness(stiffness)
+        self.set_damping(damping)
+        self.set_fixed(fixed)
+
+        # preallocated scratch buffers, so that stepping doesn't allocate
+        self._f = np.empty_like(self._x)
+        self._tmp = np.empty_like(self._x)
+
+        # optional torch / Dr.Jit backend running the steps
+        self.backend = backend
+        self._backend = make_backend(self, backend)
+
+        # no collisions by default (see `set_collisions`)
+        self.collisions = None
+        self.collision_ms = 0.0
+        self.num_contacts = 0
+
+    def set_stiffness(self, stiffness):
+        """Update k (and the spring term c = k * L @ x0), keeping the current state"""
+        self.k = self._batch_param(stiffness, "stiffness")
+        self._k[:] = np.repeat(np.broadcast_to(self.k, len(self._k) // 3), 3)
+        self._laplacian(self._x0, out=self.c)
+        self.c *= self._k
+        self._update_constant_forces()
+
+    def set_damping(self, damping):
+        """Update the damping coefficient, keeping the current state"""
+        self.damping = self._batch_param(damping, "damping")
+        self._damping[:] = np.repeat(
+            np.broadcast_to(self.damping, len(self._k) // 3), 3
+        )
+        if self._backend is not None:
+            self._backend.load_parameters()
+
+    def set_gravity(self, gravity):
+        """Update gravity, keeping the current state"""
+        nb = len(self._k) // 3
+        gravity = np.array(gravity, float)
+        if gravity.shape not in [(3,), (nb, 3)]:
+            raise ValueError("gravity must be a 3-vector or a (B,3) array")
+        self.gravity = gravity
+        self._gravity[:] = np.broadcast_to(gravity, (nb, 3)).ravel()
+        self._update_constant_forces()
+
+    def set_fixed(self, fixed):
+        """
+        Update the pinned vertices, keeping the current state.
+        fixed : list of vertex‐indices, (N,) boolean mask or (B,N) boolean mask when batched
+        """
+        nb = len(self._k) // 3
+        fixed_mask = np.zeros((nb, self.N), dtype=bool)
+        if fixed is not None:
+            fixed = np.asarray(fixed)
+            if fixed.dtype == bool and fixed.ndim == 2:
+                if fixed.shape != (nb, self.N):
+                    raise ValueError("fixed mask must be of shape (B,N)")
+                fixed_mask[:] = fixed
+            elif fixed.dtype == bool:
+                fixed_mask[:] = fixed[None]
+            else:
+                fixed_mask[:, fixed.astype(int)] = True
+        # fixed‐vertex mask, (N,) or (B,N) when batched
+        self.fixed = fixed_mask if self.B is not None else fixed_mask[0]
+        # flat indices (into the (N, B*3) state arrays) of pinned entries
+        self._fixed_idx = np.flatnonzero(np.repeat(fixed_mask.T, 3, axis=1))
+        self._x0_fixed = self._x0.ravel()[self._fixed_idx]
+        if self._backend is not None:
+            self._backend.load_parameters()
+
+    def set_collisions(
+        self,
+        ground=None,
+        box=None,
+        self_collision=False,
+        radius=0.4,
+        restitution=0.0,
+        friction=0.0,
+    ):
+        """
+        Enable collisions, resolved after each step (pass no argument to disable them).
+        ground         : optional (normal, offset) plane, points are kept where normal . x >= offset
+        box            : optional (lo, hi) corners of an axis-aligned box containing the points
+        self_collision : if True, points are spheres of radius `radius` that can't overlap
+                         (found with a spatial hash, so it scales linearly)
+        restitution    : fraction of the normal velocity bounced back on contact
+        friction       : fraction of the tangential velocity removed on ground contact
+        """
+        if ground is None and box is None and not self_collision:
+            self.collisions = None
+            return
+        if ground is not None:
+            normal = np.array(ground[0], float)
+            ground = (normal / np.linalg.norm(normal), float(ground[1]))
+        if box is not None:
+            box = (np.array(box[0], float), np.array(box[1], float))
+        self.collisions = dict(
+            ground=ground,
+            box=box,
+            self_collision=self_collision,
+            radius=radius,
+            restitution=restitution,
+            friction=friction,
+        )
+        # one hash per batch member, so that each can be re-sorted incrementally
+        nb = len(self._k) // 3
+        self._hashes = [SpatialHash(2.0 * radius) for _ in range(nb)]
+
+    def _update_constant_forces(self):
+        """Constant forces: c + m * g"""
+        np.multiply(self._M, self._gravity, out=self._F_const)
+        self._F_const += self.c
+        if self._backend is not None:
+            self._backend.load_parameters()
+
+    def _batch_view(self, a):
+        """(N, B*3) internal array -> (N,3) or (B,N,3) view"""
+        if self.B is None:
+            return a
+        return a.reshape(self.N, self.B, 3).transpose(1, 0, 2)
+
+    def _batch_param(self, value, name):
+        """Validate a scalar (or length-B when batched) parameter"""
+        if np.isscalar(value):
+            return float(value)
+        value = np.array(value, dtype=float)
+        if self.B is None or value.shape != (self.B,):
+            raise ValueError(f"{name} must be a scalar or a length-B array")
+        return value
+
+    def _build_grid(self):
+        """Linear indices of the voxels in a (padded) dense grid"""
+        # pad by one voxel on each side, so that every neighbour index is valid
+        grid_coords = self.coords - self.coords.min(axis=0) + 1
+        self.grid_shape = tuple(grid_coords.max(axis=0) + 2)
+        self._grid_idx = np.ravel_multi_index(grid_coords.T, self.grid_shape)
+        # linear offsets to the +x, +y and +z neighbours
+        self._grid_strides = np.array(
+            [self.grid_shape[1] * self.grid_shape[2], self.grid_shape[2], 1]
+        )
+
+    def _build_edges(self):
+        """(i, j) pairs of 6-neighbours, ordered by i and then by axis"""
+        order = np.argsort(self._grid_idx)
+        sorted_idx = self._grid_idx[order]
         pairs = []
-        for i, c in enumerate(self.coords):
-            for dx, dy, dz in offsets:
-                nb = (c[0] + dx, c[1] + dy, c[2] + dz)
-                j = coord_to_idx.get(nb)
-                if j is not None:
-                    pairs.append((i, j))
-        self.edges = np.array(pairs, dtype=int)
-
-        # assemble sparse Laplacian L = D - A
+        for axis, stride in enumerate(self._grid_strides):
+            # look up the +axis neighbour of every voxel
+            nb_idx = self._grid_idx + stride
+            pos = np.minimum(np.searchsorted(sorted_idx, nb_idx), self.N - 1)
+            i = np.nonzero(sorted_idx[pos] == nb_idx)[0]
+            pairs.append(np.stack([i, order[pos[i]], np.full_like(i, axis)], axis=-1))
+        pairs = np.concatenate(pairs, axis=0)
+        pairs = pairs[np.lexsort((pairs[:, 2], pairs[:, 0]))]
+        return pairs[:, :2].astype(int)
+
+    def _init_sparse_laplacian(self):
+        """Assemble L as a sparse (CSR) matrix"""
         i_idx = np.hstack([self.edges[:, 0], self.edges[:, 1]])
         j_idx = np.hstack([self.edges[:, 1], self.edges[:, 0]])
         data = np.ones_like(i_idx, dtype=float)
         A = sp.coo_matrix((data, (i_idx, j_idx)), shape=(self.N, self.N))
         deg = np.array(A.sum(axis=1)).ravel()
-        self.L = sp.diags(deg) - A
+        self.L = (sp.diags(deg) - A).tocsr().astype(self.dtype)
+        self._csr_matvecs = self._check_csr_matvecs()
 
-        # precompute spring term: c = k * L @ x0
-        self.c = self.k * (self.L.dot(self.x0))
+    def _check_csr_matvecs(self):
+        """csr_matvecs if it computes L @ x here (once), None to fall back to L @ x"""
+        if csr_matvecs is None:
+            return None
+        x = np.random.default_rng(0).random(self._x.shape).astype(self.dtype)
+        out = np.zeros_like(x)
+        try:
+            csr_matvecs(
+                self.N,
+                self.N,
+                x.shape[1],
+                self.L.indptr,
+                self.L.indices,
+                self.L.data,
+                x.ravel(),
+                out.ravel(),
+            )
+        except Exception:
+            return None
+        tol = 1e-4 if self.dtype == np.float32 else 1e-10
+        if not np.allclose(out, self.L @ x, rtol=tol, atol=tol):
+            return None
+        return csr_matvecs
 
-        # fixed‐vertex mask
-        if fixed is None:
-            self.fixed = np.zeros(self.N, dtype=bool)
-        else:
-            mask = np.zeros(self.N, dtype=bool)
-            mask[np.array(fixed, dtype=int)] = True
-            self.fixed = mask
+    def _laplacian(self, x, out):
+        """out = L @ x, written in place"""
+        if self._csr_matvecs is None:
+            out[:] = self.L @ x
+            return
+        out.fill(0.0)
+        self._csr_matvecs(
+            self.N,
+            self.N,
+            x.shape[1],
+            self.L.indptr,
+            self.L.indices,
+            self.L.data,
+            x.ravel(),
+            out.ravel(),
+        )
 
     def step(self, dt):
-        # spring force
-        F_spring = -self.k * (self.L.dot(self.x)) + self.c
-        # gravity force
-        F_grav = (1.0 / self.Minv)[:, None] * self.gravity
-        # damping
-        F_damp = -self.damping * self.v
+        if self._backend is not None:
+            self._backend.step(dt)
+        else:
+            self._integrate(dt)
 
-        F_total = F_spring + F_grav + F_damp
-        F_total[self.fixed] = 0.0
+        if self.collisions is not None:
+            self._collide()
+
+    def _integrate(self, dt):
+        F_total = self._f
+
+        # spring force + constant forces (i.e., c + gravity)
+        self._laplacian(self._x, out=F_total)
+        F_total *= -self._k
+        F_total += self._F_const
+        # damping
+        np.multiply(self._v, self._damping, out=self._tmp)
+        F_total -= self._tmp
 
         # semi‐implicit Euler
-        self.v += dt * (F_total * self.Minv[:, None])
-        self.v[self.fixed] = 0.0
+        F_total *= self._Minv
+        F_total *= dt
+        self._v += F_total
+        np.put(self._v, self._fixed_idx, 0.0)
+
+        np.multiply(self._v, dt, out=self._tmp)
+        self._x += self._tmp
+        np.put(self._x, self._fixed_idx, self._x0_fixed)
+
+    def _collide(self):
+        """Resolve ground, box and self collisions (positions and velocities)"""
+        start = time.perf_counter()
+        col = self.collisions
+        e = col["restitution"]
+        self.num_contacts = 0
+
+        for b, spatial_hash in enumerate(self._hashes):
+            x = self.x if self.B is None else self.x[b]
+            v = self.v if self.B is None else self.v[b]
+
+            # ground plane: project back, bounce the normal velocity and apply friction
+            if col["ground"] is not None:
+                n, offset = col["ground"]
+                d = x @ n - offset
+                hit = np.nonzero(d < 0.0)[0]
+                x[hit] -= d[hit, None] * n
+                vn = v[hit] @ n
+                vt = v[hit] - vn[:, None] * n
+                vn = np.where(vn < 0.0, -e * vn, vn)
+                v[hit] = (1.0 - col["friction"]) * vt + vn[:, None] * n
+                self.num_contacts += len(hit)
+
+            # box: clamp and bounce the outgoing velocity components
+            if col["box"] is not None:
+                lo, hi = col["box"]
+                below, above = x < lo, x > hi
+                np.clip(x, lo, hi, out=x)
+                v[below & (v < 0.0)] *= -e
+                v[above & (v > 0.0)] *= -e
+                self.num_contacts += np.count_nonzero(below | above)
+
+            # self collisions: push overlapping spheres apart, remove approaching velocity
+            if col["self_collision"]:
+                pairs = spatial_hash.query_pairs(x)
+                if len(pairs) == 0:
+                    continue
+                i, j = pairs[:, 0], pairs[:, 1]
+                d = x[j] - x[i]
+                dist = np.maximum(np.linalg.norm(d, axis=-1), 1e-12)
+                n = d / dist[:, None]
+                penetration = 0.5 * (2.0 * col["radius"] - dist)
+                v_rel = np.einsum("ij,ij->i", v[j] - v[i], n)
+                impulse = 0.5 * (1.0 + e) * np.minimum(v_rel, 0.0)
+                N = self.N
+                for axis in range(3):
+                    dx = penetration * n[:, axis]
+                    dv = impulse * n[:, axis]
+                    x[:, axis] += np.bincount(j, dx, N) - np.bincount(i, dx, N)
+                    v[:, axis] += np.bincount(i, dv, N) - np.bincount(j, dv, N)
+                self.num_contacts += len(pairs)
+
+        # pinned vertices stay pinned
+        np.put(self._v, self._fixed_idx, 0.0)
+        np.put(self._x, self._fixed_idx, self._x0_fixed)
+        if self._backend is not None:
+            self._backend.load_state()
 
-        self.x += dt * self.v
-        self.x[self.fixed] = self.x0[self.fixed]
+        self.collision_ms = (time.perf_counter() - start) * 1000.0
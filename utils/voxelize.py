@@ -1,11 +1,22 @@
 import numpy as np
+import scipy.sparse as sp
 import trimesh
+from scipy.spatial import cKDTree
+
+from utils.sparse_voxels import RunLengthVoxels
 
 # Vibe-coded with ChatGPT!
 
+# Offset of the rays of `column_hits` (in voxels), so that they never exactly go
+# through the edges or vertices of meshes with "round" coordinates
+RAY_JITTER = np.array([1.31e-6, 0.77e-6])
+
 
 def mesh_to_voxel_grid_indices(
-    mesh: trimesh.Trimesh, resolution: int = 100, method: str = "subdivide"
+    mesh: trimesh.Trimesh,
+    resolution: int = 100,
+    method: str = "subdivide",
+    return_transform: bool = False,
 ) -> tuple:
     """
     Voxelize a triangular mesh and return integer voxel indices of occupied cells.
@@ -16,8 +27,12 @@ def mesh_to_voxel_grid_indices(
         The input mesh to voxelize.
     resolution : int
         Number of voxels along the longest axis of the mesh’s bounding box.
-    method : str, {'subdivide', 'ray', 'scipy'}
-        Voxelization method for trimesh.voxelized().
+    method : str, {'subdivide', 'ray', 'scipy', 'parity', 'sat'}
+        Voxelization method: 'subdivide' and 'ray' use trimesh.voxelized() (surface shell),
+        'scipy' fills the 'subdivide' shell (scipy.ndimage), 'parity' is the (vectorized)
+        solid voxelizer of `voxelize_parity` and 'sat' the surface one of `voxelize_sat`.
+    return_transform : bool
+        If True, also return the (4, 4) transform mapping voxel indices to voxel centers.
 
     Returns
     -------
@@ -25,6 +40,8 @@ def mesh_to_voxel_grid_indices(
         Boolean array where True indicates an occupied voxel.
     indices : np.ndarray of shape (N, 3), dtype=int
         Integer grid coordinates (i, j, k) of each occupied voxel.
+    transform : np.ndarray of shape (4, 4), optional
+        Maps (homogeneous) voxel indices to the mesh space.
     """
     # 1. Compute bounding box and pitch
     bounds = mesh.bounds
@@ -34,11 +51,299 @@ def mesh_to_voxel_grid_indices(
     pitch = longest / resolution
 
     # 2. Voxelize
-    voxel_grid = mesh.voxelized(pitch, method=method)
-    occupancy = voxel_grid.matrix.copy()  # shape (nx, ny, nz)
+    if method in ("parity", "sat"):
+        voxelize = voxelize_parity if method == "parity" else voxelize_sat
+        occupancy, transform = voxelize(mesh, pitch)
+    else:
+        voxel_grid = mesh.voxelized(
+            pitch, method="subdivide" if method == "scipy" else method
+        )
+        if method == "scipy":
+            voxel_grid = voxel_grid.fill()
+        occupancy = voxel_grid.matrix.copy()  # shape (nx, ny, nz)
+        transform = voxel_grid.transform.copy()
 
     # 3. Get integer indices of occupied voxels
     #    np.argwhere returns an array of shape (N, 3) with (i, j, k) coords
     indices = np.argwhere(occupancy)
 
+    if return_transform:
+        return occupancy, indices, transform
     return occupancy, indices
+
+
+def voxel_grid_frame(mesh: trimesh.Trimesh, pitch: float) -> tuple:
+    """
+    Grid of voxels (centered at integer multiples of `pitch`, as trimesh) covering the mesh.
+
+    Returns
+    -------
+    vertices : np.ndarray of shape (V, 3)
+        Mesh vertices in voxel index space (i.e., voxel centers are at integer coordinates).
+    shape : np.ndarray of shape (3,)
+        Number of voxels along each axis.
+    transform : np.ndarray of shape (4, 4)
+        Maps (homogeneous) voxel indices to the mesh space.
+    """
+    lo = np.round(mesh.bounds[0] / pitch)
+    hi = np.round(mesh.bounds[1] / pitch)
+    transform = np.eye(4)
+    transform[:3, :3] *= pitch
+    transform[:3, 3] = lo * pitch
+    vertices = mesh.vertices / pitch - lo
+    return vertices, (hi - lo + 1).astype(int), transform
+
+
+def expand_ranges(start: np.ndarray, stop: np.ndarray) -> tuple:
+    """
+    Enumerate all the integer points of the (inclusive) boxes [start, stop] of shape (T, D).
+
+    Returns the (P,) index of the box of each point and the (P, D) points.
+    """
+    sizes = np.maximum(stop - start + 1, 0)
+    counts = np.prod(sizes, axis=-1)
+    box = np.repeat(np.arange(len(start)), counts)
+    local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    points = np.empty((len(local), start.shape[-1]), dtype=start.dtype)
+    for d in reversed(range(start.shape[-1])):
+        local, points[:, d] = np.divmod(local, sizes[box, d])
+    return box, start[box] + points
+
+
+def cross2(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
+
+
+def column_hits(vertices: np.ndarray, faces: np.ndarray, shape, axis: int) -> tuple:
+    """
+    Intersections of the triangles with the rays (along `axis`) through the voxel centers.
+
+    Returns
+    -------
+    columns : np.ndarray of shape (H,)
+        Linear index of the ray (over the two other axes, in increasing order).
+    t : np.ndarray of shape (H,)
+        Coordinate of the intersection along `axis` (in voxel index space).
+    """
+    other = [a for a in range(3) if a != axis]
+    tri = vertices[faces]
+    # Tiny offset: rays never exactly go through edges/vertices (which would hit twice)
+    tri2 = tri[..., other] - RAY_JITTER
+    start = np.maximum(np.ceil(tri2.min(axis=1)), 0).astype(int)
+    stop = np.minimum(np.floor(tri2.max(axis=1)), shape[other] - 1).astype(int)
+    face, ij = expand_ranges(start, stop)
+
+    # Barycentric coordinates of the rays in the (projected) triangles
+    a, b, c = (tri2[face, i] - ij for i in range(3))
+    area = cross2(b - a, c - a)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        l0 = cross2(b, c) / area
+        l1 = cross2(c, a) / area
+        l2 = 1.0 - l0 - l1
+    inside = (l0 > 0) & (l1 > 0) & (l2 > 0)
+
+    face, ij = face[inside], ij[inside]
+    t = (np.stack([l0[inside], l1[inside], l2[inside]], -1) * tri[face, :, axis]).sum(
+        -1
+    )
+    return ij[:, 0] * shape[other[1]] + ij[:, 1], t
+
+
+def voxelize_parity(
+    mesh: trimesh.Trimesh, pitch: float, axes: tuple = (0, 1, 2)
+) -> tuple:
+    """
+    Solid voxelization by (vectorized) parity ray casting: a voxel is inside if the ray
+    through its center crossed the surface an odd number of times before reaching it.
+
+    Rays are cast along each of `axes`, and voxels are kept if a majority of them agree:
+    this makes the result robust to small holes of non-watertight meshes.
+
+    Returns
+    -------
+    occupancy : np.ndarray of shape (nx, ny, nz), dtype=bool
+    transform : np.ndarray of shape (4, 4)
+    """
+    vertices, shape, transform = voxel_grid_frame(mesh, pitch)
+    votes = np.zeros(shape, dtype=np.uint8)
+    for axis in axes:
+        other = [a for a in range(3) if a != axis]
+        n = shape[axis]
+        columns, t = column_hits(vertices, mesh.faces, shape, axis)
+        # Each hit toggles the voxels above it, i.e. from floor(t) + 1
+        first = np.clip(np.floor(t).astype(int) + 1, 0, n)
+        keys, counts = np.unique(columns * (n + 1) + first, return_counts=True)
+        toggles = np.zeros((*shape[other], n + 1), dtype=np.uint8)
+        toggles.reshape(-1)[keys] = counts & 1
+        inside = np.bitwise_xor.accumulate(toggles, axis=-1)[..., :n]
+        votes += np.moveaxis(inside, -1, axis)
+    return 2 * votes > len(axes), transform
+
+
+def voxelize_parity_runs(mesh: trimesh.Trimesh, pitch: float) -> tuple:
+    """
+    Same as `voxelize_parity` with rays along z only, but directly outputs the runs
+    between consecutive hits: nothing dense is ever allocated, so this scales to high
+    resolutions. Columns with an odd number of hits (i.e., going through a hole of the
+    mesh) are left empty.
+
+    Returns
+    -------
+    voxels : RunLengthVoxels
+    transform : np.ndarray of shape (4, 4)
+    """
+    vertices, shape, transform = voxel_grid_frame(mesh, pitch)
+    columns, t = column_hits(vertices, mesh.faces, shape, axis=2)
+    order = np.lexsort((t, columns))
+    columns, t = columns[order], t[order]
+
+    # Rank of each hit in its column, and number of hits of its column
+    col_ids, col_start, col_hits = np.unique(
+        columns, return_index=True, return_counts=True
+    )
+    rank = np.arange(len(t)) - np.repeat(col_start, col_hits)
+    even = np.repeat(col_hits % 2 == 0, col_hits)
+
+    # Voxels between an entering (even rank) and leaving hit are inside
+    enter = np.nonzero(even & (rank % 2 == 0))[0]
+    first = np.clip(np.floor(t).astype(int) + 1, 0, shape[2])
+    voxels = RunLengthVoxels.from_runs(
+        shape, columns[enter], first[enter], first[enter + 1]
+    )
+    return voxels, transform
+
+
+def mesh_to_sparse_voxels(
+    mesh: trimesh.Trimesh, resolution: int = 100, method: str = "parity"
+) -> tuple:
+    """
+    Sparse (run-length encoded) counterpart of `mesh_to_voxel_grid_indices`.
+
+    With method 'parity', runs are computed directly (see `voxelize_parity_runs`);
+    other methods go through the dense occupancy.
+
+    Returns
+    -------
+    voxels : RunLengthVoxels
+        Use `voxels.to_indices()` / `voxels.to_occupancy()` for the outputs of
+        `mesh_to_voxel_grid_indices`.
+    transform : np.ndarray of shape (4, 4)
+        Maps (homogeneous) voxel indices to the mesh space.
+    """
+    pitch = (mesh.bounds[1] - mesh.bounds[0]).max() / resolution
+    if method == "parity":
+        return voxelize_parity_runs(mesh, pitch)
+    occupancy, _, transform = mesh_to_voxel_grid_indices(
+        mesh, resolution, method, return_transform=True
+    )
+    return RunLengthVoxels.from_occupancy(occupancy), transform
+
+
+def voxelize_sat(
+    mesh: trimesh.Trimesh, pitch: float, max_pairs: int = 1 << 18
+) -> tuple:
+    """
+    Surface voxelization: voxels overlapping a triangle, by the separating axis theorem
+    ("Fast 3D Triangle-Box Overlap Testing", Akenine-Möller 2001), vectorized over
+    (triangle, voxel) pairs, processed by chunks of about `max_pairs`.
+    The separating axes (and the extent of the triangles along them) are computed once
+    per triangle: testing a voxel then only projects its center onto them.
+
+    Returns
+    -------
+    occupancy : np.ndarray of shape (nx, ny, nz), dtype=bool
+    transform : np.ndarray of shape (4, 4)
+    """
+    vertices, shape, transform = voxel_grid_frame(mesh, pitch)
+    occupancy = np.zeros(shape, dtype=bool)
+    tri = vertices[mesh.faces]
+
+    # Voxels overlapping the bounding box of each triangle
+    start = np.maximum(np.ceil(tri.min(axis=1) - 0.5), 0).astype(int)
+    stop = np.minimum(np.floor(tri.max(axis=1) + 0.5), shape - 1).astype(int)
+    counts = np.prod(np.maximum(stop - start + 1, 0), axis=-1)
+    splits = np.searchsorted(
+        np.cumsum(counts), np.arange(max_pairs, counts.sum(), max_pairs)
+    )
+
+    # Separating axes (besides the box axes, covered by the bounding boxes):
+    # the triangle normal, and the cross products of the edges and the box axes
+    e = np.roll(tri, -1, axis=1) - tri
+    normal = np.cross(e[:, 0], e[:, 1])
+    crosses = np.cross(e[:, :, None], np.eye(3)[None, None]).reshape(-1, 9, 3)
+    axes = np.concatenate([normal[:, None], crosses], axis=1)  # shape (T, 10, 3)
+    # Extent of the triangles along the axes, and "radius" of a voxel along them
+    proj = np.einsum("tac,tvc->tav", axes, tri)
+    lo, hi = proj.min(-1), proj.max(-1)
+    radius = 0.5 * np.abs(axes).sum(-1)
+
+    for faces in np.split(np.arange(len(tri)), np.unique(splits)):
+        face, voxels = expand_ranges(start[faces], stop[faces])
+        face = faces[face]
+        center = np.einsum("pac,pc->pa", axes[face], voxels)
+        separated = (lo[face] - center > radius[face]) | (
+            hi[face] - center < -radius[face]
+        )
+        overlap = ~separated.any(axis=-1)
+        occupancy[tuple(voxels[overlap].T)] = True
+    return occupancy, transform
+
+
+def trilinear_embedding(points: np.ndarray, indices: np.ndarray) -> sp.csr_matrix:
+    """
+    Embed points into a voxel lattice with trilinear weights.
+
+    Parameters
+    ----------
+    points : np.ndarray of shape (P, 3)
+        Points expressed in voxel index space (i.e., voxel centers are at integer coordinates).
+    indices : np.ndarray of shape (N, 3), dtype=int
+        Integer grid coordinates of the lattice nodes (e.g., occupied voxels).
+
+    Returns
+    -------
+    weights : scipy.sparse.csr_matrix of shape (P, N)
+        Interpolation weights, such that `weights @ positions` moves the points along with
+        the (N, 3) node `positions`. Missing corners are dropped and the remaining weights
+        renormalized; points without any occupied corner follow their nearest node.
+    """
+    # 1. Linear keys of the lattice nodes, for fast lookups
+    lo = indices.min(axis=0) - 1
+    shape = indices.max(axis=0) - lo + 2
+    keys = np.ravel_multi_index((indices - lo).T, shape)
+    order = np.argsort(keys)
+    sorted_keys = keys[order]
+
+    # 2. The 8 corners of the cell containing each point, and their weights
+    base = np.floor(points).astype(int)
+    t = points - base
+    corners = np.stack(np.meshgrid([0, 1], [0, 1], [0, 1], indexing="ij"), -1)
+    corners = corners.reshape(-1, 3)
+    corner_coords = base[:, None] + corners[None]  # shape (P, 8, 3)
+    w = np.prod(np.where(corners[None] == 1, t[:, None], 1.0 - t[:, None]), axis=-1)
+
+    # 3. Look up the corners (outside of the lattice bounds = missing)
+    rel = np.clip(corner_coords - lo, 0, shape - 1)
+    corner_keys = np.ravel_multi_index(rel.reshape(-1, 3).T, shape).reshape(w.shape)
+    pos = np.minimum(np.searchsorted(sorted_keys, corner_keys), len(keys) - 1)
+    inside = np.all(rel == corner_coords - lo, axis=-1)
+    found = (sorted_keys[pos] == corner_keys) & inside
+    w = np.where(found, w, 0.0)
+    cols = order[pos]
+
+    # 4. Renormalize, or fall back to the nearest node
+    w_sum = w.sum(axis=-1)
+    orphans = w_sum <= 1e-8
+    w[~orphans] /= w_sum[~orphans, None]
+    if orphans.any():
+        _, nearest = cKDTree(indices).query(points[orphans])
+        w[orphans] = 0.0
+        w[orphans, 0] = 1.0
+        cols[orphans, 0] = nearest
+
+    rows = np.repeat(np.arange(len(points)), 8)
+    weights = sp.csr_matrix(
+        (w.ravel(), (rows, cols.ravel())), shape=(len(points), len(indices))
+    )
+    weights.eliminate_zeros()
+    return weights